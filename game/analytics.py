@@ -0,0 +1,122 @@
+
+# ----- Libraries ----- #
+import json
+import math
+import time
+import argparse
+import numpy as np
+# ----- --------- ----- #
+
+import game
+from game import store_logger
+
+# ----- Constant ----- #
+QUESTIONS = 5
+CHOICES = 4
+# A distractor that fewer players than this pick is not doing its job.
+DISTRACTOR_SHARE = 0.05
+# ----- -------- ----- #
+
+
+def answer_columns(keys: list[tuple[int, list[int]]],
+                   answers: list[tuple[int, bytes, bytes]]) -> tuple[np.ndarray, ...]:
+    # Every attempt becomes one row of (attempts, QUESTIONS) matrices; quizzes get dense indices.
+    quiz_ids = np.array([q_idx for q_idx, _ in keys], dtype=np.int64)
+    key = np.array([correct for _, correct in keys], dtype=np.int64)
+    order = np.argsort(quiz_ids)
+    quiz_ids = quiz_ids[order]
+    key = key[order]
+
+    attempt_quiz = np.searchsorted(quiz_ids, np.array([q_idx for q_idx, _, _ in answers], dtype=np.int64))
+    choices = np.frombuffer(b"".join(choices for _, choices, _ in answers), dtype=np.int8)
+    seconds = np.frombuffer(b"".join(seconds for _, _, seconds in answers), dtype=np.float32)
+    return quiz_ids, key, attempt_quiz, choices.reshape(-1, QUESTIONS).astype(np.int64), seconds.reshape(-1, QUESTIONS)
+
+def question_stats(keys: list[tuple[int, list[int]]], answers: list[tuple[int, bytes, bytes]]) -> list[tuple]:
+    if not answers:
+        return []
+    quiz_ids, key, attempt_quiz, choices, seconds = answer_columns(keys, answers)
+    correct = (choices == key[attempt_quiz]).astype(np.float64)
+    answered = choices > 0
+    # Each answer is judged against the rest of that attempt, so an item does not correlate with itself.
+    rest = correct.sum(axis=1, keepdims=True) - correct
+
+    groups = len(quiz_ids) * QUESTIONS
+    group = (attempt_quiz[:, None] * QUESTIONS + np.arange(QUESTIONS))[answered]
+    x = correct[answered]
+    y = rest[answered]
+    count = np.bincount(group, minlength=groups)
+    sum_x = np.bincount(group, x, groups)
+    sum_y = np.bincount(group, y, groups)
+    sum_xy = np.bincount(group, x * y, groups)
+    sum_yy = np.bincount(group, y * y, groups)
+    total_seconds = np.bincount(group, seconds[answered], groups)
+
+    # Point-biserial correlation between getting the item right and the rest score.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spread = (count * sum_x - sum_x ** 2) * (count * sum_yy - sum_y ** 2)
+        discrimination = np.where(spread > 0, (count * sum_xy - sum_x * sum_y) / np.sqrt(spread), np.nan)
+        difficulty = sum_x / count
+        mean_seconds = total_seconds / count
+
+        slot = group * CHOICES + choices[answered] - 1
+        picks = np.bincount(slot, minlength=groups * CHOICES).reshape(groups, CHOICES)
+        rest_by_choice = np.bincount(slot, y, groups * CHOICES).reshape(groups, CHOICES) / picks
+        right = key.reshape(-1) - 1
+        right_rest = rest_by_choice[np.arange(groups), right]
+        # A working distractor draws a fair share of players, and mostly weaker ones.
+        working = (
+            (picks >= DISTRACTOR_SHARE * count[:, None])
+            & (rest_by_choice < right_rest[:, None])
+            & (np.arange(CHOICES) != right[:, None])
+        ).sum(axis=1)
+
+    # Rows are assembled column-wise; a per-row Python loop would dominate on large stores.
+    idx = np.flatnonzero(count)
+    discrimination = np.round(discrimination[idx], 4).tolist()
+    return list(zip(
+        quiz_ids[idx // QUESTIONS].tolist(),
+        (idx % QUESTIONS).tolist(),
+        count[idx].tolist(),
+        np.round(difficulty[idx], 4).tolist(),
+        [None if math.isnan(value) else value for value in discrimination],
+        np.round(mean_seconds[idx], 3).tolist(),
+        *(picks[idx, choice].tolist() for choice in range(CHOICES)),
+        working[idx].tolist()
+    ))
+
+def analyze(store: game.Quiz_store) -> tuple[int, int]:
+    keys = []
+    raw_keys, answers = store.load_answers()
+    for q_idx, correct in raw_keys:
+        correct = json.loads(correct)
+        # Quizzes whose answer key is not five choices from 1 to 4 cannot be scored.
+        if len(correct) == QUESTIONS and all(answer in ["1", "2", "3", "4"] for answer in correct):
+            keys.append((q_idx, [int(answer) for answer in correct]))
+    valid = {q_idx for q_idx, _ in keys}
+    answers = [row for row in answers if row[0] in valid and len(row[1]) == QUESTIONS and len(row[2]) == 4 * QUESTIONS]
+    rows = question_stats(keys, answers)
+    store.save_question_stats(rows)
+    store_logger.info("Analyze (%d) attempts into (%d) question stats", len(answers), len(rows))
+    return len(answers), len(rows)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Recompute per-question difficulty, discrimination and distractor stats from recorded answers"
+    )
+    parser.add_argument("--db", default=game.DB_PATH, help="quiz store to analyze")
+    args = parser.parse_args()
+
+    listener = game.setup_logger()
+    try:
+        store = game.Quiz_store(args.db)
+        start = time.monotonic()
+        attempts, questions = analyze(store)
+        print(f"Analyzed {attempts} attempts into {questions} question stats in {time.monotonic() - start:.2f}s")
+        store.conn.close()
+    finally:
+        listener.stop()
+
+if __name__ == "__main__":
+    main()
+# End of file
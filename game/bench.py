@@ -0,0 +1,562 @@
+
+# ----- Libraries ----- #
+import os
+import sys
+import atexit
+import shutil
+import time
+import random
+import argparse
+import json
+import tempfile
+import statistics
+import subprocess
+# ----- --------- ----- #
+
+# ----- benchmark environment ----- #
+# Never touch the real store or log, and never reach a real display.
+BENCH_DIR = tempfile.mkdtemp(prefix="quiz_bench_")
+atexit.register(shutil.rmtree, BENCH_DIR, True)
+os.environ["DATABASE_PATH"] = BENCH_DIR
+os.environ["LOG_PATH"] = BENCH_DIR
+os.environ.setdefault("MISTRAL_API_KEY", "benchmark")
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+shutil.copy(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "database", "prompt.txt"),
+    BENCH_DIR
+)
+
+import game
+# ----- ----------------------- ----- #
+
+
+WORDS = [
+    "quantum", "mechanics", "roman", "empire", "cell", "biology", "linear", "algebra",
+    "world", "war", "history", "python", "programming", "machine", "learning", "organic",
+    "chemistry", "music", "theory", "art", "renaissance", "thermodynamics", "economics",
+    "micro", "macro", "ancient", "greek", "philosophy", "calculus", "statistics", "genetics",
+]
+
+
+def make_topic(idx: int) -> str:
+    return " ".join(random.sample(WORDS, random.randint(2, 3))) + f" {chr(97 + idx % 26)}"
+
+def make_quiz(idx: int) -> dict[str, any]:
+    scores = [random.randint(0, 5) for _ in range(random.randint(1, 9))]
+    return {
+        "topic": f"benchmark topic {idx}",
+        "questions": [f"Question {q} of benchmark topic {idx}?" for q in range(5)],
+        "choices": [[f"choice {c}" for c in range(1, 5)] for _ in range(5)],
+        "correct_answers": [str(random.randint(1, 4)) for _ in range(5)],
+        "use_count": len(scores),
+        "all_score": scores,
+        "correct_percentage": round(100 * sum(scores) / (5 * len(scores)), 3)
+    }
+
+def make_store(size: int) -> str:
+    db_path = os.path.join(BENCH_DIR, f"quizzes_{size}.db")
+    if not os.path.exists(db_path):
+        store = game.Quiz_store(db_path)
+        with store.conn:
+            store.insert_quizzes((idx, make_quiz(idx)) for idx in range(size))
+        store.conn.close()
+    return db_path
+
+def report(name: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(0.95 * (len(samples) - 1))]
+    print(f"{name:<40} median {1000 * statistics.median(samples):8.3f} ms   p95 {1000 * p95:8.3f} ms")
+
+def bench_record_data(sizes: list[int], games: int) -> None:
+    for size in sizes:
+        quizzes_data = game.Quizzes_data(make_store(size))
+        update_samples = []
+        insert_samples = []
+        for _ in range(games):
+            q_idx = random.randrange(size)
+            data = make_quiz(q_idx)
+            data["use_count"] = 1
+            data["all_score"] = [random.randint(0, 5)]
+            is_new_quiz = quizzes_data.use_counts[q_idx] >= game.REUSE_LIMIT
+            start = time.perf_counter()
+            quizzes_data.record_data(is_new_quiz, q_idx, data["topic"], data)
+            update_samples.append(time.perf_counter() - start)
+
+            data = make_quiz(len(quizzes_data.all_topics))
+            data["use_count"] = 1
+            data["all_score"] = [random.randint(0, 5)]
+            start = time.perf_counter()
+            quizzes_data.record_data(True, 0, data["topic"], data)
+            insert_samples.append(time.perf_counter() - start)
+        report(f"record_data replay quiz @ {size} quizzes", update_samples)
+        report(f"record_data new quiz    @ {size} quizzes", insert_samples)
+        quizzes_data.store.conn.close()
+
+def bench_memory(sizes: list[int], lookups: int) -> None:
+    import tracemalloc
+
+    for size in sizes:
+        db_path = make_store(size)
+        start = time.perf_counter()
+        quizzes_data = game.Quizzes_data(db_path)
+        load = time.perf_counter() - start
+        quizzes_data.store.conn.close()
+        # Tracing slows every allocation down, so memory is measured on a second, untimed load.
+        tracemalloc.start()
+        quizzes_data = game.Quizzes_data(db_path)
+        resident = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        samples = []
+        for _ in range(lookups):
+            q_idx = random.randrange(size)
+            start = time.perf_counter()
+            quizzes_data.quiz(q_idx)
+            samples.append(time.perf_counter() - start)
+        print(f"load {size} quizzes in {load:.2f} s, {resident / 2**20:.1f} MiB resident ({resident / size:.0f} bytes/quiz)")
+        report(f"quiz body on demand @ {size} quizzes", samples)
+        quizzes_data.store.conn.close()
+
+def bench_prompt(sizes: list[int], lookups: int) -> None:
+    mistral_ai = game.MistralAI()
+    for size in sizes:
+        topics = [make_topic(idx) for idx in range(size)]
+        start = time.perf_counter()
+        retriever = game.Topic_retriever(topics)
+        build = time.perf_counter() - start
+
+        samples = []
+        for _ in range(lookups):
+            topic = make_topic(random.randrange(size))
+            start = time.perf_counter()
+            shortlist = retriever.nearest(topic)
+            samples.append(time.perf_counter() - start)
+
+        full_prompt = len(mistral_ai.build_prompt(topic, topics))
+        short_prompt = len(mistral_ai.build_prompt(topic, shortlist))
+        print(
+            f"prompt @ {size} topics: all topics {full_prompt} chars, "
+            f"shortlist {short_prompt} chars, index build {build:.2f} s"
+        )
+        report(f"nearest topics @ {size} topics", samples)
+
+def make_gameplay() -> game.Gameplay:
+    game.pygame.init()
+    gameplay = game.Gameplay()
+    quiz = make_quiz(0)
+    quiz["questions"] = [
+        "Which of the following statements best explains why the observed behaviour "
+        f"of the system changes when the boundary conditions in scenario {q} are relaxed?"
+        for q in range(5)
+    ]
+    quiz["choices"] = [
+        [f"A fairly long answer choice number {c} that has to wrap over two lines" for c in range(1, 5)]
+        for _ in range(5)
+    ]
+    gameplay.player.name = "benchmark"
+    gameplay.questions = quiz["questions"]
+    gameplay.choices = quiz["choices"]
+    gameplay.correct_answers = quiz["correct_answers"]
+    gameplay.stage = game.GameStage.QUIZ
+    return gameplay
+
+def bench_frames(frames: int) -> None:
+    gameplay = make_gameplay()
+    for name, cached in (("uncached", False), ("cached", True)):
+        samples = []
+        for frame in range(frames):
+            if not cached and hasattr(gameplay, "text_cache"):
+                gameplay.text_cache.clear()
+            gameplay.q_number = frame % 5
+            start = time.perf_counter()
+            gameplay.surface.blit(gameplay.background(game.GameStage.QUIZ), (0, 0))
+            gameplay.draw_interface()
+            game.pygame.display.flip()
+            samples.append(time.perf_counter() - start)
+        report(f"QUIZ frame ({name})", samples)
+
+def bench_logging(records: int) -> None:
+    # A small maxBytes makes the file roll over every ~1000 records. The short sleep stands in
+    # for the rest of a frame; without it the listener competes with the caller for the GIL.
+    formatter = game.logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    for name in ("sync", "queued"):
+        path = os.path.join(BENCH_DIR, f"{name}.log")
+        if name == "sync":
+            handler = game.RotatingFileHandler(path, maxBytes=100_000, backupCount=5)
+        else:
+            handler = game.Batched_file_handler(path, maxBytes=100_000, backupCount=5)
+        handler.setFormatter(formatter)
+        logger = game.logging.getLogger(f"bench.{name}")
+        logger.propagate = False
+        logger.setLevel(game.logging.INFO)
+        listener = None
+        if name == "sync":
+            logger.addHandler(handler)
+        else:
+            log_queue = game.queue.SimpleQueue()
+            logger.addHandler(game.Deferred_queue_handler(log_queue))
+            listener = game.Log_listener(log_queue, handler)
+            listener.start()
+
+        samples = []
+        for record in range(records):
+            start = time.perf_counter()
+            logger.info(
+                "Player: (%s) select choice: (%d) on question: (%d)",
+                "benchmark", record % 4 + 1, record % 5 + 1
+            )
+            samples.append(time.perf_counter() - start)
+            time.sleep(0.0001)
+        if listener is not None:
+            listener.stop()
+        else:
+            handler.close()
+        report(f"log call ({name})", samples)
+        print(f"{'':<40} max    {1000 * max(samples):8.3f} ms")
+
+def bench_room(sizes: list[int]) -> None:
+    import asyncio
+    import json
+    import server
+
+    async def run(players: int, topic: str) -> tuple[list[float], list[float]]:
+        room_server = server.Room_server(
+            game.Quizzes_data(make_store(1_000)), game.Fixture_generator(), question_time=30, result_time=0
+        )
+        listener = await room_server.serve("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        joined = asyncio.Semaphore(0)
+        writers = {}
+        broadcast = []
+        collected = {}
+
+        async def client(idx: int) -> None:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writers[idx] = writer
+            writer.write(server.encode({"type": "join", "room": "bench", "name": f"player {idx}"}))
+            sent = None
+            async for line in reader:
+                message = json.loads(line)
+                if message["type"] == "joined":
+                    joined.release()
+                elif message["type"] == "question":
+                    sent = message["sent"]
+                    broadcast.append(time.perf_counter() - sent)
+                    writer.write(server.encode(
+                        {"type": "answer", "question": message["question"], "choice": random.randint(1, 4)}
+                    ))
+                elif message["type"] == "result":
+                    question = message["question"]
+                    collected[question] = max(collected.get(question, 0), time.perf_counter() - sent)
+                elif message["type"] in ["end", "error"]:
+                    break
+            writer.close()
+
+        clients = [asyncio.create_task(client(idx)) for idx in range(players)]
+        for _ in range(players):
+            await joined.acquire()
+        # The first player to join is the host.
+        host = room_server.rooms["bench"].host.name
+        writers[int(host.split()[-1])].write(server.encode({"type": "start", "topic": topic}))
+        await asyncio.gather(*clients)
+        listener.close()
+        await listener.wait_closed()
+        room_server.close()
+        return broadcast, [players / seconds for seconds in collected.values()]
+
+    for idx, players in enumerate(sizes):
+        broadcast, rates = asyncio.run(run(players, f"room benchmark {chr(97 + idx)}"))
+        report(f"room of {players}: question broadcast", broadcast)
+        print(f"{'':<40} {statistics.median(rates):8.0f} answers/s per question (median)")
+
+def bench_generate(calls: int) -> None:
+    import threading
+    import standin
+
+    server = standin.make_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    backends = [
+        ("fixture", game.Fixture_generator()),
+        ("stand-in over HTTP", game.OpenAI_compatible(url, "standin")),
+        ("stand-in, new connection each call", game.OpenAI_compatible(url, "standin")),
+        ("stand-in behind the response cache", game.Cached_generator(
+            game.OpenAI_compatible(url, "standin"), os.path.join(BENCH_DIR, "responses")
+        )),
+    ]
+    for streamed in (False, True):
+        game.STREAM_QUIZ = streamed
+        for name, generator in backends:
+            samples = []
+            for call in range(calls):
+                if name.endswith("each call"):
+                    generator.drop_connection()
+                parser = game.Quiz_parser()
+                start = time.perf_counter()
+                generator.generate(f"generate benchmark {call % 10}", [], parser)
+                samples.append(time.perf_counter() - start)
+                assert parser.finished
+            report(f"{name} ({'stream' if streamed else 'call'})", samples)
+    server.shutdown()
+
+def type_topic(engine: game.Game_engine, topic: str, rng: random.Random) -> None:
+    # Keystrokes 50-200 ms apart, sometimes a longer pause between words, then a pause before Enter.
+    pauses = [rng.uniform(0.05, 0.2) for _ in topic]
+    for idx, char in enumerate(topic):
+        if char == " " and rng.random() < 0.3:
+            pauses[idx] = rng.uniform(0.6, 1.2)
+    pauses[-1] = rng.uniform(0.2, 1.5)
+    for char, pause in zip(topic, pauses):
+        engine.handle(game.Action.TYPE, char)
+        until = time.monotonic() + pause
+        while time.monotonic() < until:
+            engine.step()
+            time.sleep(1 / game.FPS)
+
+def bench_prefetch(sessions: int, delay: float) -> None:
+    quizzes_data = game.Quizzes_data(make_store(1_000))
+    generator = game.Fixture_generator(delay)
+    for prefetch_delay in (0.0, game.PREFETCH_DELAY):
+        game.PREFETCH_DELAY = prefetch_delay
+        stats = game.PREFETCH_STATS = game.Prefetch_stats()
+        rng = random.Random(0)
+        samples = []
+        for session in range(sessions):
+            engine = game.Game_engine(quizzes_data, generator)
+            engine.stage = game.GameStage.TOPIC
+            type_topic(engine, f"{make_topic(session)} {chr(97 + session // 26)}", rng)
+            start = time.perf_counter()
+            engine.handle(game.Action.ENTER)
+            while engine.stage == game.GameStage.GENERATE_QUIZ:
+                engine.step()
+                time.sleep(0.001)
+            samples.append(time.perf_counter() - start)
+            engine.close()
+        name = f"wait after Enter, prefetch {'off' if not prefetch_delay else f'after {prefetch_delay}s pause'}"
+        report(name, samples)
+        if prefetch_delay:
+            print(f"{'':<40} {stats.hits}/{stats.started} prefetches used, {stats.wasted} wasted (~{stats.wasted_tokens} tokens)")
+
+def bench_refresh(rounds: int, delay: float) -> None:
+    generator = game.Fixture_generator(delay)
+    for refresh_ahead in (0, game.REFRESH_AHEAD):
+        game.REFRESH_AHEAD = refresh_ahead
+        db_path = os.path.join(BENCH_DIR, f"refresh_{refresh_ahead}.db")
+        shutil.copy(make_store(1_000), db_path)
+        engine = game.Game_engine(game.Quizzes_data(db_path), generator)
+        engine.stage = game.GameStage.TOPIC
+        engine.player.topic = "benchmark topic"
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            engine.handle(game.Action.ENTER)
+            while engine.stage == game.GameStage.GENERATE_QUIZ:
+                engine.step()
+                time.sleep(0.001)
+            samples.append(time.perf_counter() - start)
+            # A game lasts longer than a generation; the refresh has that long to land.
+            until = time.monotonic() + 2 * delay
+            while engine.stage != game.GameStage.END:
+                if engine.stage in [game.GameStage.CORRECT, game.GameStage.INCORRECT]:
+                    engine.handle(game.Action.ENTER)
+                elif engine.pending_answer is None and engine.q_number < len(engine.questions):
+                    engine.handle(game.Action.CHOOSE, random.randint(1, 4))
+                while engine.q_number >= 4 and time.monotonic() < until:
+                    engine.step()
+                    time.sleep(1 / game.FPS)
+                engine.step()
+            engine.handle(game.Action.CONTINUE)
+        cold = sum(sample > delay / 2 for sample in samples)
+        report(f"wait after Enter, refresh {f'{refresh_ahead} uses ahead' if refresh_ahead else 'off'}", samples)
+        print(f"{'':<40} {cold} of {rounds} games waited for a generation")
+        engine.close()
+
+def bench_idle(seconds: float) -> None:
+    # Runs the real loop on a static QUIZ screen; start_game ends with pygame.quit().
+    gameplay = make_gameplay()
+    game.pygame.time.set_timer(game.pygame.QUIT, int(1000 * seconds), 1)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    gameplay.start_game()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    print(f"idle QUIZ screen: {cpu:.3f} s CPU over {wall:.1f} s ({100 * cpu / wall:.1f}% of a core)")
+
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import game
+imported = time.perf_counter()
+game.pygame.init()
+gameplay = game.Gameplay()
+present = gameplay.present
+def first_frame(scene):
+    present(scene)
+    print(f"startup {imported - start:.4f} {time.perf_counter() - start:.4f}")
+    game.pygame.event.post(game.pygame.event.Event(game.pygame.QUIT))
+    gameplay.present = present
+gameplay.present = first_frame
+gameplay.start_game()
+"""
+
+def bench_startup(runs: int, limit: float) -> bool:
+    env = {**os.environ, "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+    imports, frames = [], []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT], env=env, cwd=BENCH_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout
+        fields = next(line for line in out.splitlines() if line.startswith("startup ")).split()
+        imports.append(float(fields[1]))
+        frames.append(float(fields[2]))
+    report("import game", imports)
+    report("time to first frame", frames)
+
+    # -X importtime writes "cumulative | self | package" lines to stderr.
+    profile = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import game"], env=env, cwd=BENCH_DIR,
+        capture_output=True, text=True, check=True
+    ).stderr.splitlines()
+    direct = []
+    for line in profile:
+        fields = line.split("|")
+        # Modules imported directly by game.py are indented by exactly one level.
+        if len(fields) == 3 and fields[1].strip().isdigit() and fields[2].startswith("   ") \
+                and not fields[2].startswith("    "):
+            direct.append((int(fields[1].strip()), fields[2].strip()))
+    for micros, package in sorted(direct, reverse=True)[:5]:
+        print(f"    {package:<36} {micros / 1000:8.1f} ms")
+
+    first_frame = statistics.median(frames)
+    if limit and first_frame > limit:
+        print(f"time to first frame {first_frame:.3f} s exceeds the {limit:.3f} s limit")
+        return False
+    return True
+
+REPLAY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay.py")
+SAMPLE_SESSION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "database", "sample_session.jsonl.gz")
+REPLAY_MIN_SAMPLES = 20
+
+def bench_replay(recording: str, sizes: list[int], runs: int, baseline: str, threshold: float, save: bool) -> bool:
+    import replay
+
+    # Each replay gets a fresh process, so peak memory belongs to that store size alone.
+    env = {**os.environ, "SDL_VIDEODRIVER": "dummy"}
+    results = {}
+    samples = {}
+    for size in sizes:
+        replays = []
+        for _ in range(runs):
+            db_path = os.path.join(BENCH_DIR, f"replay_{size}.db")
+            shutil.copy(make_store(size), db_path)
+            result_path = os.path.join(BENCH_DIR, f"replay_{size}.json")
+            subprocess.run(
+                [sys.executable, REPLAY_PATH, "play", recording, "--db", db_path, "--json", result_path],
+                env=env, cwd=BENCH_DIR, stdout=subprocess.DEVNULL, check=True
+            )
+            with open(result_path, "r") as file:
+                replays.append(json.load(file))
+        wall = statistics.median(result["wall"] for result in replays)
+        memory = statistics.median(result["peak_memory"] for result in replays) / 2**20
+        print(f"replay @ {size} quizzes: {replays[0]['loops']} loops in {wall:.2f} s, peak memory {memory:.1f} MiB")
+        results[f"peak MiB @ {size}"] = memory
+        samples[f"peak MiB @ {size}"] = runs
+
+        # Percentiles come from every run's samples pooled, not from a median of per-run percentiles.
+        pooled = {}
+        for result in replays:
+            for name, stage, encoded in result["histograms"]:
+                pooled.setdefault((name, stage), []).append(replay.decode_histogram(encoded))
+        for (name, stage), histograms in sorted(pooled.items()):
+            if name not in ("frame", "first_question", "record_data"):
+                continue
+            histogram = replay.merge_histograms(histograms)
+            p50, p95, p99 = (1000 * histogram.percentile(percent) for percent in (50, 95, 99))
+            label = f"{name} {stage or 'all'}" if name == "frame" else name
+            print(f"    {label:<36} p50 {p50:8.3f} ms   p95 {p95:8.3f} ms   p99 {p99:8.3f} ms   n={histogram.count}")
+            results[f"{label} p95 ms @ {size}"] = p95
+            samples[f"{label} p95 ms @ {size}"] = histogram.count
+
+    if save:
+        with open(baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"saved replay baseline to {baseline}")
+        return True
+    if not baseline:
+        return True
+    with open(baseline, "r") as file:
+        expected = json.load(file)
+    regressions = []
+    for key, value in results.items():
+        if key not in expected:
+            continue
+        # A p95 over a handful of samples is its worst sample; it cannot tell a regression from noise.
+        if not key.startswith("peak") and samples[key] < REPLAY_MIN_SAMPLES:
+            print(f"not gated: {key} has {samples[key]} samples, fewer than {REPLAY_MIN_SAMPLES}")
+            continue
+        if value > expected[key] * (1 + threshold):
+            regressions.append((key, expected[key], value))
+    for key, before, after in regressions:
+        print(f"regression: {key} {before:.3f} -> {after:.3f} (limit +{100 * threshold:.0f}%)")
+    return not regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Quiz game benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--idle", type=float, default=3.0)
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--room-sizes", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--startup-limit", type=float, default=0.0,
+                        help="fail when the median time to first frame exceeds this many seconds")
+    parser.add_argument("--prefetch-sessions", type=int, default=20)
+    parser.add_argument("--llm-delay", type=float, default=1.0, help="seconds the stand-in generator takes")
+    parser.add_argument("--refresh-rounds", type=int, default=40)
+    parser.add_argument("--memory-sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--recording", default=SAMPLE_SESSION, help="session recorded with replay.py record")
+    parser.add_argument("--replay-sizes", type=int, nargs="+", default=[10, 10_000, 100_000])
+    parser.add_argument("--replay-runs", type=int, default=5, help="replays per store size, pooled")
+    parser.add_argument("--baseline", default="", help="replay results to compare against, as written by --save-baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run's replay results to --baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="fail when a replay result is this much worse than the baseline")
+    parser.add_argument("--only", choices=["storage", "memory", "prompt", "frames", "idle", "startup", "logging", "room", "generate", "prefetch", "refresh", "replay"])
+    args = parser.parse_args()
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline needs --baseline")
+
+    random.seed(0)
+    if args.only in (None, "storage"):
+        bench_record_data(args.sizes, args.games)
+    if args.only in (None, "memory"):
+        bench_memory(args.memory_sizes, args.games)
+    if args.only in (None, "prompt"):
+        bench_prompt(args.sizes, args.games)
+    if args.only in (None, "frames"):
+        bench_frames(args.frames)
+    if args.only in (None, "logging"):
+        bench_logging(args.records)
+    if args.only in (None, "generate"):
+        bench_generate(args.calls)
+    if args.only in (None, "prefetch"):
+        bench_prefetch(args.prefetch_sessions, args.llm_delay)
+    if args.only in (None, "refresh"):
+        bench_refresh(args.refresh_rounds, args.llm_delay)
+    if args.only in (None, "room"):
+        bench_room(args.room_sizes)
+    if args.only in (None, "startup") and not bench_startup(args.startup_runs, args.startup_limit):
+        sys.exit(1)
+    if args.only in (None, "idle"):
+        bench_idle(args.idle)
+    if args.only in (None, "replay") and not bench_replay(
+            args.recording, args.replay_sizes, args.replay_runs, args.baseline, args.threshold, args.save_baseline):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
+# End of file
@@ -2,52 +2,259 @@
 # ----- Libraries ----- #
 import os
 import dotenv
+import functools
 import json
+import time
+import sqlite3
+import hashlib
+import http.client
+import urllib.parse
+import bisect
+import queue
+import threading
 import pygame
+from abc import ABC, abstractmethod
 from enum import Enum
-from mistralai import Mistral
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from typing import TYPE_CHECKING, Iterator
 import logging
-from logging.handlers import RotatingFileHandler
-import numpy as np
-import matplotlib.pyplot as plt
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+# mistralai, numpy and matplotlib are imported where they are first needed.
+if TYPE_CHECKING:
+    import numpy as np
+    from mistralai import Mistral
 # ----- --------- ----- #
 
 # ----- load environment variables ----- #
-dotenv.load_dotenv()
+# .env is read without touching os.environ; real environment variables win.
+ENV = {**dotenv.dotenv_values(), **os.environ}
 # ----- -------------------------- ----- #
 
 # ----- path ----- #
-DATABASE_PATH = os.environ["DATABASE_PATH"]
+DATABASE_PATH = ENV.get("DATABASE_PATH", "database")
 DATA_PATH = DATABASE_PATH + "//quizzes_data.json"
+DB_PATH = DATABASE_PATH + "//quizzes_data.db"
 PROMPT_PATH = DATABASE_PATH + "//prompt.txt"
-PLOT_PATH = DATABASE_PATH + "//plot//plot.png"
-LOG_PATH = os.environ["LOG_PATH"] + "//game.log"
+LOG_PATH = ENV.get("LOG_PATH", ".") + "//game.log"
+EVENT_LOG_PATH = ENV.get("LOG_PATH", ".") + "//events.jsonl"
+METRICS_PATH = ENV.get("METRICS_PATH", ENV.get("LOG_PATH", ".") + "//metrics.prom")
 # ----- --------- ----- #
 
-# ----- setup logger ----- #
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-handler = RotatingFileHandler(
-    LOG_PATH,
-    maxBytes=1_000_000,
-    backupCount=5
-)
+# ----- logger ----- #
+# LOG_LEVEL sets the default, LOG_LEVELS overrides subsystems: "quiz.llm=DEBUG,quiz.game=WARNING".
+logger = logging.getLogger("quiz.game")
+store_logger = logging.getLogger("quiz.store")
+llm_logger = logging.getLogger("quiz.llm")
+event_logger = logging.getLogger("quiz.events")
+LOG_LEVEL = ENV.get("LOG_LEVEL", "INFO")
+LOG_LEVELS = ENV.get("LOG_LEVELS", "")
+
+
+class Deferred_queue_handler(QueueHandler):
+    # Records are formatted by the listener thread, so log arguments must not change afterwards.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
 
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
+class Batched_file_handler(RotatingFileHandler):
+    # Writes stay in the file buffer until the listener has drained the queue.
+    def flush(self) -> None:
+        pass
 
-logger.addHandler(handler)
-# ----- ------------ ----- #
+    def flush_batch(self) -> None:
+        super().flush()
 
-# ----- setup MistralAi ----- #
-API_KEY = os.environ["MISTRAL_API_KEY"]
+
+class Log_listener(QueueListener):
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush_batch()
+            return self.queue.get(block)
+
+    def stop(self) -> None:
+        super().stop()
+        for handler in self.handlers:
+            handler.close()
+
+
+class Event_formatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({
+            "time": round(record.created, 3),
+            "event": record.msg,
+            **getattr(record, "fields", {})
+        })
+
+
+def log_event(event: str, **fields: any) -> None:
+    event_logger.info(event, extra={"fields": fields})
+
+
+def setup_logger() -> Log_listener:
+    log_queue = queue.SimpleQueue()
+
+    handler = Batched_file_handler(
+        LOG_PATH,
+        maxBytes=1_000_000,
+        backupCount=5
+    )
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handler.setFormatter(formatter)
+    handler.addFilter(lambda record: record.name != event_logger.name)
+
+    event_handler = Batched_file_handler(
+        EVENT_LOG_PATH,
+        maxBytes=1_000_000,
+        backupCount=5
+    )
+    event_handler.setFormatter(Event_formatter())
+    event_handler.addFilter(lambda record: record.name == event_logger.name)
+
+    quiz_logger = logging.getLogger("quiz")
+    quiz_logger.setLevel(LOG_LEVEL.upper())
+    for setting in filter(None, LOG_LEVELS.split(",")):
+        name, level = setting.split("=")
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+    quiz_logger.addHandler(Deferred_queue_handler(log_queue))
+
+    listener = Log_listener(log_queue, handler, event_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+# ----- ------ ----- #
+
+# ----- MistralAi ----- #
+# GENERATOR picks the backend: mistral, openai (any OpenAI-compatible server) or fixture.
 MODEL = "mistral-large-latest"
-CLIENT = Mistral(api_key=API_KEY)
-# ----- ------------------ ----- #
+GENERATOR = ENV.get("GENERATOR", "mistral")
+GENERATOR_URL = ENV.get("GENERATOR_URL", "http://127.0.0.1:8000/v1")
+GENERATOR_MODEL = ENV.get("GENERATOR_MODEL", MODEL)
+GENERATOR_API_KEY = ENV.get("GENERATOR_API_KEY", "")
+FIXTURE_DELAY = float(ENV.get("FIXTURE_DELAY", 0))
+RESPONSE_CACHE = ENV.get("RESPONSE_CACHE", "")
+CLIENT = None
+CLIENT_LOCK = threading.Lock()
+
+
+def get_client() -> "Mistral":
+    global CLIENT
+    with CLIENT_LOCK:
+        if CLIENT is None:
+            from mistralai import Mistral
+            CLIENT = Mistral(api_key=ENV["MISTRAL_API_KEY"])
+    return CLIENT
+# ----- --------- ----- #
+
+# ----- metrics ----- #
+METRICS_INTERVAL = float(ENV.get("METRICS_INTERVAL", 15))
+DEBUG_OVERLAY = ENV.get("DEBUG_OVERLAY", "0") == "1"
 
-# ----- pygame_init ------ #
-pygame.init()
-# ----- ----------- ------ #
+
+class Latency_histogram:
+    # Log-linear buckets over microseconds as in HdrHistogram: 32 per power of two,
+    # so a percentile is reported within ~3% of the recorded value.
+    SUB_BUCKETS = 32
+
+    def __init__(self) -> None:
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+
+    @classmethod
+    def bucket(cls, micros: int) -> int:
+        shift = micros.bit_length() - 6
+        if shift <= 0:
+            return micros
+        return shift * cls.SUB_BUCKETS + (micros >> shift)
+
+    @classmethod
+    def bucket_top(cls, bucket: int) -> int:
+        shift = bucket // cls.SUB_BUCKETS - 1
+        if shift <= 0:
+            return bucket
+        return ((bucket - shift * cls.SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        bucket = self.bucket(int(seconds * 1_000_000))
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, percent: float) -> float:
+        rank = max(1, round(percent / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return self.bucket_top(bucket) / 1_000_000
+        return 0.0
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.written = time.monotonic()
+
+    def record(self, name: str, seconds: float, stage: str = "") -> None:
+        with self.lock:
+            histogram = self.histograms.get((name, stage))
+            if histogram is None:
+                histogram = self.histograms[(name, stage)] = Latency_histogram()
+            histogram.record(seconds)
+
+    def summary(self) -> list[tuple[str, str, int, float, float, float, float]]:
+        with self.lock:
+            return [
+                (name, stage, histogram.count, histogram.total,
+                 histogram.percentile(50), histogram.percentile(95), histogram.percentile(99))
+                for (name, stage), histogram in sorted(self.histograms.items())
+            ]
+
+    def prometheus(self) -> str:
+        lines = [
+            "# HELP quiz_latency_seconds Latency of game operations and frames.",
+            "# TYPE quiz_latency_seconds summary"
+        ]
+        for name, stage, count, total, p50, p95, p99 in self.summary():
+            labels = f'name="{name}"' + (f',stage="{stage}"' if stage else "")
+            for quantile, value in (("0.5", p50), ("0.95", p95), ("0.99", p99)):
+                lines.append(f'quiz_latency_seconds{{{labels},quantile="{quantile}"}} {value:.6f}')
+            lines.append(f"quiz_latency_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"quiz_latency_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str = METRICS_PATH) -> None:
+        # Scrapers never see a half-written file.
+        with open(path + ".tmp", "w") as file:
+            file.write(self.prometheus())
+        os.replace(path + ".tmp", path)
+        self.written = time.monotonic()
+
+    def write_due(self) -> None:
+        if METRICS_INTERVAL and time.monotonic() - self.written >= METRICS_INTERVAL:
+            self.write()
+
+
+METRICS = Metrics()
+
+
+def timed(name: str):
+    def decorate(function):
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                METRICS.record(name, time.perf_counter() - start)
+        return timed_function
+    return decorate
+# ----- ------- ----- #
 
 # ----- Constant ----- #
 SURFACE_WIDHT = 1000
@@ -56,6 +263,24 @@ QUESTION_WIDTH = 1000
 QUESTION_HEIGHT = 300
 RECT_WIDTH = 500
 RECT_HEIGHT = 200
+GENERATE_TIMEOUT = float(ENV.get("GENERATE_TIMEOUT", 60))
+STREAM_QUIZ = ENV.get("STREAM_QUIZ", "1") == "1"
+PREFETCH_DELAY = float(ENV.get("PREFETCH_DELAY", 0.3))
+PREFETCH_LIMIT = int(ENV.get("PREFETCH_LIMIT", 1))
+PREFETCH_TOKEN_BUDGET = int(ENV.get("PREFETCH_TOKEN_BUDGET", 20_000))
+PREFETCH_RESPONSE_TOKENS = 600
+REFRESH_AHEAD = int(ENV.get("REFRESH_AHEAD", 2))
+REUSE_LIMIT = 10
+STORE_BUSY_TIMEOUT = float(ENV.get("STORE_BUSY_TIMEOUT", 30))
+QUIZ_CACHE_SIZE = 64
+PROMPT_TOPIC_LIMIT = 20
+MINHASH_PERMUTATIONS = 64
+TEXT_CACHE_BYTES = 16_000_000
+FPS = int(ENV.get("FPS", 30))
+IDLE_WAIT = 1000
+PLOT_RENDERER = ENV.get("PLOT_RENDERER", "pygame")
+PLOT_WIDTH = 640
+PLOT_HEIGHT = 480
 # ----- -------- ----- #
 
 # ----- Color ----- #
@@ -66,75 +291,879 @@ GREEN = (0,139,139)
 YELLOW = (253, 208, 23)
 BLUE = (69,163,229)
 LIGHT_PURPLE = (203, 195, 227)
+SKY_BLUE = (135, 206, 235)
 # ------ ---- ----- #
 
 
+# Digits and these symbols tell topics apart: "World War 1" from "World War 2", "C++" and "C#" from "C".
+TOPIC_SYMBOLS = "+#"
+ASCII_TOPIC_CHARS = bytes(
+    code if chr(code).isalnum() or chr(code) in TOPIC_SYMBOLS else ord(" ") for code in range(256)
+)
+
+def normalize_topic(topic: str) -> str:
+    topic = topic.lower()
+    # Loading a large store normalizes every topic; the per-character loop is only needed outside ASCII.
+    if topic.isascii():
+        return " ".join(topic.encode().translate(ASCII_TOPIC_CHARS).decode().split())
+    chars = "".join(ch if ch.isalnum() or ch in TOPIC_SYMBOLS else " " for ch in topic)
+    return " ".join(chars.split())
+
 class Player:
     def __init__(self):
         self.name = ""
         self.topic = ""
         self.score = 0
 
+class Quiz_store:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS quizzes (
+            id INTEGER PRIMARY KEY,
+            topic TEXT NOT NULL,
+            questions TEXT NOT NULL,
+            choices TEXT NOT NULL,
+            correct_answers TEXT NOT NULL,
+            use_count INTEGER NOT NULL,
+            correct_percentage REAL NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            replaced_by INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS scores (
+            quiz_id INTEGER NOT NULL REFERENCES quizzes(id),
+            score INTEGER NOT NULL,
+            choices BLOB,
+            seconds BLOB
+        );
+        CREATE INDEX IF NOT EXISTS scores_quiz_id ON scores(quiz_id);
+        CREATE INDEX IF NOT EXISTS quizzes_leaderboard
+            ON quizzes(correct_percentage DESC, id)
+            WHERE use_count >= 5 AND correct_percentage <= 90;
+        CREATE TABLE IF NOT EXISTS topic_aliases (
+            alias TEXT PRIMARY KEY,
+            topic TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS store_version (
+            version INTEGER NOT NULL
+        );
+        INSERT INTO store_version SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM store_version);
+        CREATE TABLE IF NOT EXISTS question_stats (
+            quiz_id INTEGER NOT NULL REFERENCES quizzes(id),
+            question INTEGER NOT NULL,
+            answers INTEGER NOT NULL,
+            difficulty REAL NOT NULL,
+            discrimination REAL,
+            mean_seconds REAL NOT NULL,
+            picks_1 INTEGER NOT NULL,
+            picks_2 INTEGER NOT NULL,
+            picks_3 INTEGER NOT NULL,
+            picks_4 INTEGER NOT NULL,
+            working_distractors INTEGER NOT NULL,
+            PRIMARY KEY (quiz_id, question)
+        );
+    """
+    # Columns added after the first release, with the definition older stores get them with.
+    ADDED_COLUMNS = {
+        "quizzes": [("version", "INTEGER NOT NULL DEFAULT 0"), ("replaced_by", "INTEGER")],
+        "topic_aliases": [("version", "INTEGER NOT NULL DEFAULT 0")],
+        "scores": [("choices", "BLOB"), ("seconds", "BLOB")]
+    }
+    VERSION_INDEXES = """
+        CREATE INDEX IF NOT EXISTS quizzes_version ON quizzes(version);
+        CREATE INDEX IF NOT EXISTS topic_aliases_version ON topic_aliases(version);
+    """
+
+    def __init__(self, db_path: str = DB_PATH, json_path: str = DATA_PATH) -> None:
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=STORE_BUSY_TIMEOUT)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.upgrade()
+        self.conn.executescript(self.VERSION_INDEXES)
+        if self.is_empty() and os.path.exists(json_path):
+            self.migrate_json(json_path)
+
+    def write(self) -> sqlite3.Connection:
+        # Several games can share one store; BEGIN IMMEDIATE takes the write lock before
+        # anything is read, so read-modify-write steps cannot interleave across processes.
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def upgrade(self) -> None:
+        # Stores made before versioned rows get the column with every row at version 0.
+        with self.write():
+            for table, added in self.ADDED_COLUMNS.items():
+                columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+                for column, definition in added:
+                    if column not in columns:
+                        self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                        store_logger.info("Add column (%s) to (%s) in (%s)", column, table, self.db_path)
+
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM quizzes LIMIT 1").fetchone() is None
+
+    def migrate_json(self, json_path: str) -> None:
+        with open(json_path, "r") as file:
+            my_data = json.load(file)
+        with self.write():
+            # Another game may have migrated while this one waited for the lock.
+            if not self.is_empty():
+                return
+            self.insert_quizzes(list(enumerate(my_data["all_quizzes"])))
+            self.insert_aliases(my_data.get("topic_aliases", {}))
+        store_logger.info(
+            "Migrate (%d) quizzes from (%s) to (%s)",
+            len(my_data["all_quizzes"]), json_path, self.db_path
+        )
+
+    def next_version(self) -> int:
+        return self.conn.execute("UPDATE store_version SET version = version + 1 RETURNING version").fetchone()[0]
+
+    def insert_quizzes(self, quizzes: list[tuple[int, dict[str, any]]], version: int = 0) -> None:
+        for q_idx, quiz in quizzes:
+            self.conn.execute(
+                "INSERT INTO quizzes "
+                "(id, topic, questions, choices, correct_answers, use_count, correct_percentage, version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    q_idx, quiz["topic"],
+                    json.dumps(quiz["questions"]),
+                    json.dumps(quiz["choices"]),
+                    json.dumps(quiz["correct_answers"]),
+                    quiz["use_count"], quiz["correct_percentage"], version
+                )
+            )
+            self.insert_scores(q_idx, quiz["all_score"], quiz.get("all_answers", []))
+
+    def insert_scores(self, q_idx: int, scores: list[int], answers: list[tuple[bytes, bytes]]) -> None:
+        # answers[i] holds player i's (choices, seconds) arrays, one slot per question;
+        # scores recorded without them keep NULLs and are left out of the analytics.
+        answers = answers + [(None, None)] * (len(scores) - len(answers))
+        self.conn.executemany(
+            "INSERT INTO scores (quiz_id, score, choices, seconds) VALUES (?, ?, ?, ?)",
+            [(q_idx, score, choices, seconds) for score, (choices, seconds) in zip(scores, answers)]
+        )
+
+    def insert_aliases(self, aliases: dict[str, str], version: int = 0) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO topic_aliases (alias, topic, version) VALUES (?, ?, ?)",
+            [(alias, topic, version) for alias, topic in aliases.items()]
+        )
+
+    def load_changes(self, since: int) -> tuple[int, list[tuple[int, str, int, float]], dict[str, str]]:
+        # Every write bumps store_version and stamps the rows it touched, so a reader only
+        # fetches what changed after the version it last saw. The version is read first:
+        # a write landing in between is fetched now and again next time, never missed.
+        version = self.conn.execute("SELECT version FROM store_version").fetchone()[0]
+        if version == since:
+            return version, [], {}
+        rows = self.conn.execute(
+            "SELECT id, topic, use_count, correct_percentage FROM quizzes WHERE version > ?", (since,)
+        ).fetchall()
+        aliases = dict(self.conn.execute("SELECT alias, topic FROM topic_aliases WHERE version > ?", (since,)))
+        # Sorted in Python: ORDER BY id would make SQLite scan the table instead of the version index.
+        rows.sort()
+        return version, rows, aliases
+
+    def load_quiz(self, q_idx: int) -> dict[str, any]:
+        row = self.conn.execute("SELECT * FROM quizzes WHERE id = ?", (q_idx,)).fetchone()
+        return {
+            "topic": row[1],
+            "questions": json.loads(row[2]),
+            "choices": json.loads(row[3]),
+            "correct_answers": json.loads(row[4]),
+            "use_count": row[5],
+            "all_score": [score for score, in self.conn.execute(
+                "SELECT score FROM scores WHERE quiz_id = ? ORDER BY rowid", (q_idx,)
+            )],
+            "correct_percentage": row[6]
+        }
+
+    def load_leaderboard(self) -> list[tuple[float, int]]:
+        rows = self.conn.execute(
+            "SELECT correct_percentage, id FROM quizzes "
+            "WHERE use_count >= 5 AND correct_percentage <= 90 "
+            "ORDER BY correct_percentage DESC, id"
+        )
+        return [(-percentage, q_idx) for percentage, q_idx in rows]
+
+    def add_quiz(self, quiz: dict[str, any]) -> int:
+        return self.add_quizzes([quiz], {})[0]
+
+    def add_quizzes(self, quizzes: list[dict[str, any]], aliases: dict[str, str]) -> list[int]:
+        # Ids are handed out under the write lock, so games that add quizzes at the
+        # same time get different ones.
+        with self.write():
+            version = self.next_version()
+            first = self.conn.execute("SELECT COALESCE(MAX(id), -1) + 1 FROM quizzes").fetchone()[0]
+            rows = list(enumerate(quizzes, first))
+            self.insert_quizzes(rows, version)
+            self.insert_aliases(aliases, version)
+        return [q_idx for q_idx, _ in rows]
+
+    def replace_quiz(self, q_idx: int, quiz: dict[str, any]) -> int | None:
+        # The replacement is a new row under the same topic, so the retired quiz keeps its
+        # scores; whichever game commits first wins and the others drop theirs.
+        with self.write():
+            if self.conn.execute("SELECT replaced_by FROM quizzes WHERE id = ?", (q_idx,)).fetchone()[0] is not None:
+                return None
+            version = self.next_version()
+            new_idx = self.conn.execute("SELECT MAX(id) + 1 FROM quizzes").fetchone()[0]
+            self.insert_quizzes([(new_idx, quiz)], version)
+            self.conn.execute("UPDATE quizzes SET replaced_by = ?, version = ? WHERE id = ?", (new_idx, version, q_idx))
+        return new_idx
+
+    def add_scores(self, q_idx: int, scores: list[int], answers: list[tuple[bytes, bytes]], limit: int = REUSE_LIMIT) -> bool:
+        # Counters are computed from what is in the store, not from this game's copy,
+        # so scores other games recorded meanwhile are kept.
+        with self.write():
+            version = self.next_version()
+            updated = self.conn.execute(
+                "UPDATE quizzes SET use_count = use_count + ?, version = ? WHERE id = ? AND use_count < ?",
+                (len(scores), version, q_idx, limit)
+            ).rowcount
+            if not updated:
+                return False
+            self.insert_scores(q_idx, scores, answers)
+            self.conn.execute(
+                "UPDATE quizzes SET correct_percentage = ROUND("
+                "100.0 * (SELECT SUM(score) FROM scores WHERE quiz_id = ?) / (5 * use_count), 3) WHERE id = ?",
+                (q_idx, q_idx)
+            )
+        return True
+
+    def record_scores(self, is_new_quiz: bool, q_idx: int, data: dict[str, any]) -> None:
+        # A room records all of its players' scores in one write.
+        scores = data["all_score"]
+        # The store decides whether the quiz still has uses left; another game may have used them up.
+        if is_new_quiz or not self.add_scores(q_idx, scores, data.get("all_answers", [])):
+            data["use_count"] = len(scores)
+            data["correct_percentage"] = round(100 * sum(scores) / (5 * len(scores)), 3)
+            self.add_quiz(data)
+
+    def load_answers(self) -> tuple[list[tuple[int, str]], list[tuple[int, bytes, bytes]]]:
+        # Only quizzes that have recorded answers, with the answer key to score them against.
+        with self.conn:
+            self.conn.execute("BEGIN")
+            keys = self.conn.execute(
+                "SELECT id, correct_answers FROM quizzes "
+                "WHERE id IN (SELECT quiz_id FROM scores WHERE choices IS NOT NULL)"
+            ).fetchall()
+            answers = self.conn.execute(
+                "SELECT quiz_id, choices, seconds FROM scores WHERE choices IS NOT NULL"
+            ).fetchall()
+        return keys, answers
+
+    def save_question_stats(self, rows: list[tuple]) -> None:
+        with self.write():
+            self.conn.execute("DELETE FROM question_stats")
+            self.conn.executemany("INSERT INTO question_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def load_question_stats(self, q_idx: int) -> list[dict[str, any]]:
+        cursor = self.conn.execute("SELECT * FROM question_stats WHERE quiz_id = ? ORDER BY question", (q_idx,))
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def save_alias(self, alias: str, topic: str) -> None:
+        with self.write():
+            self.insert_aliases({alias: topic}, self.next_version())
+
+class Topic_retriever:
+    CHUNK_SIZE = 2048
+
+    def __init__(self, topics: list[str], permutations: int = MINHASH_PERMUTATIONS) -> None:
+        import numpy as np
+
+        rng = np.random.default_rng(0)
+        # Multiply-shift hashing: odd 64-bit multipliers, keep the high 32 bits.
+        self.a = rng.integers(1, 2**63, permutations, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, permutations, dtype=np.uint64)
+        self.topics = []
+        self.seen = set()
+        self.signatures = np.zeros((max(len(topics), 16), permutations), dtype=np.uint32)
+        unique_topics = []
+        keys = []
+        for topic in topics:
+            key = normalize_topic(topic)
+            if key not in self.seen:
+                self.seen.add(key)
+                unique_topics.append(topic)
+                keys.append(key)
+        for start in range(0, len(keys), self.CHUNK_SIZE):
+            chunk = keys[start:start + self.CHUNK_SIZE]
+            self.signatures[start:start + len(chunk)] = self.signature_chunk(chunk)
+        self.topics = unique_topics
+
+    def signature_chunk(self, keys: list[str]) -> "np.ndarray":
+        import numpy as np
+
+        # Every character trigram of every normalized topic at once: three 21-bit code points packed into one key.
+        padded = [f" {key} ".ljust(3) for key in keys]
+        codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        grams = codes[:-2] | (codes[1:-1] << np.uint64(21)) | (codes[2:] << np.uint64(42))
+        counts = np.array([len(topic) - 2 for topic in padded])
+        offsets = np.cumsum(counts) - counts
+        # Each topic's trigrams start two positions later per earlier topic, skipping those straddling a boundary.
+        grams = grams[np.arange(counts.sum()) + np.repeat(2 * np.arange(len(padded)), counts)]
+        # One row per permutation: the minimum over each topic's trigrams then runs along contiguous memory.
+        permuted = ((self.a[:, None] * grams + self.b[:, None]) >> np.uint64(32)).astype(np.uint32)
+        return np.minimum.reduceat(permuted, offsets, axis=1).T
+
+    def add(self, topic: str) -> None:
+        import numpy as np
+
+        key = normalize_topic(topic)
+        if key in self.seen:
+            return
+        self.seen.add(key)
+        if len(self.topics) == len(self.signatures):
+            self.signatures = np.resize(self.signatures, (2 * len(self.signatures), self.signatures.shape[1]))
+        self.signatures[len(self.topics)] = self.signature_chunk([key])[0]
+        self.topics.append(topic)
+
+    def nearest(self, topic: str, limit: int = PROMPT_TOPIC_LIMIT) -> list[str]:
+        import numpy as np
+
+        if not self.topics:
+            return []
+        signature = self.signature_chunk([normalize_topic(topic)])[0]
+        similarity = (self.signatures[:len(self.topics)] == signature).sum(axis=1)
+        if len(self.topics) > limit:
+            candidates = np.argpartition(-similarity, limit)[:limit]
+        else:
+            candidates = np.arange(len(self.topics))
+        candidates = candidates[np.argsort(-similarity[candidates], kind="stable")]
+        return [self.topics[idx] for idx in candidates if similarity[idx] > 0]
+
+class Leaderboard:
+    def __init__(self, all_topics: list[str], keys: list[tuple[float, int]]) -> None:
+        self.all_topics = all_topics
+        # Sorted (-correct_percentage, q_idx): best rate first, ties by age.
+        self.keys = keys
+
+    @staticmethod
+    def is_ranked(use_count: int, correct_percentage: float) -> bool:
+        return use_count >= 5 and correct_percentage <= 90
+
+    def update(self, q_idx: int, old: tuple[int, float] | None, new: tuple[int, float]) -> None:
+        if old is not None and self.is_ranked(*old):
+            key = (-old[1], q_idx)
+            pos = bisect.bisect_left(self.keys, key)
+            if pos < len(self.keys) and self.keys[pos] == key:
+                del self.keys[pos]
+        if self.is_ranked(*new):
+            bisect.insort(self.keys, (-new[1], q_idx))
+
+    def top_indices(self, k: int) -> list[int]:
+        return [q_idx for _, q_idx in self.keys[:k]]
+
+    def top(self, k: int) -> list[dict[str, any]]:
+        return [
+            {"topic": self.all_topics[q_idx], "correct_percentage": -percentage}
+            for percentage, q_idx in self.keys[:k]
+        ]
+
 class Quizzes_data:
-    def __init__(self) -> None:
-        self.my_data = self.get_data()
-        self.all_topics = self.my_data["all_topics"]
-        self.all_quizzes = self.my_data["all_quizzes"]
+    def __init__(self, db_path: str = DB_PATH) -> None:
+        self.store = Quiz_store(db_path)
+        self.all_topics = []
+        # Only what lookups and rankings need stays resident, one flat array per counter;
+        # questions, choices and scores are read from the store when a quiz is played.
+        self.use_counts = array("l")
+        self.correct_percentages = array("d")
+        self.quiz_cache = OrderedDict()
+        self.topic_aliases = {}
+        self.topic_index = {}
+        self.topic_hits = 0
+        self.topic_lookups = 0
+        self.topic_retriever = None
+        self.retriever_lock = threading.Lock()
+        self.indexed_topics = 0
+        self.leaderboard = None
+        # Version -1 so the first refresh loads every row, including pre-version ones at 0.
+        self.version = -1
+        self.refresh()
         self.leaderboard = self.get_leaderboard()
 
-    def get_leaderboard(self) -> None:
-        leaderboard = []
-        for quiz in self.all_quizzes:
-            if quiz["use_count"] >= 5 and quiz["correct_percentage"] <= 90:
-                leaderboard.append(quiz)
-        return sorted(leaderboard, key=lambda x: x["correct_percentage"], reverse=True)
-
+    def lookup_topic(self, raw_topic: str) -> int | None:
+        key = normalize_topic(raw_topic)
+        q_idx = self.topic_index.get(self.topic_aliases.get(key, key))
+        if q_idx is not None and self.use_counts[q_idx] >= REUSE_LIMIT:
+            return None
+        return q_idx
+
+    def resolve_topic(self, raw_topic: str) -> int | None:
+        q_idx = self.lookup_topic(raw_topic)
+        self.topic_lookups += 1
+        if q_idx is not None:
+            self.topic_hits += 1
+        store_logger.info(
+            "Topic cache %s on: (%s), hit rate: %.1f%% (%d/%d)",
+            "miss" if q_idx is None else "hit", raw_topic,
+            100 * self.topic_hits / self.topic_lookups, self.topic_hits, self.topic_lookups
+        )
+        return q_idx
+
+    def index_topics(self) -> None:
+        with self.retriever_lock:
+            topics = self.all_topics[self.indexed_topics:]
+            if self.topic_retriever is None:
+                start = time.perf_counter()
+                self.topic_retriever = Topic_retriever(topics)
+                store_logger.info("Index (%d) topics in (%.2f) s", len(topics), time.perf_counter() - start)
+            else:
+                for topic in topics:
+                    self.topic_retriever.add(topic)
+            self.indexed_topics += len(topics)
+
+    def start_indexing(self) -> None:
+        # The first build takes seconds on a large store; it runs on its own thread at startup,
+        # never on the frame or event-loop thread and outside any generation timeout.
+        if self.topic_retriever is not None or self.retriever_lock.locked():
+            # Engines sharing one store, as in the load test, need only one build.
+            return
+        threading.Thread(target=self.index_topics, name="topic-index", daemon=True).start()
+
+    def nearest_topics(self, raw_topic: str) -> list[str]:
+        if self.topic_retriever is None and self.retriever_lock.locked():
+            # A generation does not wait for the startup build; its prompt just lists no old topics.
+            return []
+        self.index_topics()
+        with self.retriever_lock:
+            return self.topic_retriever.nearest(raw_topic)
+
+    def learn_alias(self, raw_topic: str, topic: str, save: bool = True) -> tuple[str, str] | None:
+        # With save=False the caller writes the returned alias to the store itself.
+        key = normalize_topic(raw_topic)
+        topic = normalize_topic(topic)
+        if key and key != topic and self.topic_aliases.get(key) != topic:
+            self.topic_aliases[key] = topic
+            if save:
+                self.store.save_alias(key, topic)
+            return key, topic
+        return None
+
+    @timed("get_leaderboard")
+    def get_leaderboard(self) -> Leaderboard:
+        return Leaderboard(self.all_topics, self.store.load_leaderboard())
+
+    def question_stats(self, q_idx: int) -> list[dict[str, any]]:
+        # Precomputed by analytics.py; empty until the job has seen answers for this quiz.
+        return self.store.load_question_stats(q_idx)
+
+    def quiz(self, q_idx: int) -> dict[str, any]:
+        quiz = self.quiz_cache.get(q_idx)
+        if quiz is not None:
+            self.quiz_cache.move_to_end(q_idx)
+            return quiz
+        quiz = self.quiz_cache[q_idx] = self.store.load_quiz(q_idx)
+        if len(self.quiz_cache) > QUIZ_CACHE_SIZE:
+            self.quiz_cache.popitem(last=False)
+        return quiz
+
+    @timed("refresh")
+    def refresh(self) -> int:
+        # Other games may write to the same store; pick up only the rows they changed.
+        version, rows, aliases = self.store.load_changes(self.version)
+        for q_idx, topic, use_count, correct_percentage in rows:
+            self.quiz_cache.pop(q_idx, None)
+            if q_idx < len(self.all_topics):
+                if self.leaderboard is not None:
+                    self.leaderboard.update(
+                        q_idx,
+                        (self.use_counts[q_idx], self.correct_percentages[q_idx]),
+                        (use_count, correct_percentage)
+                    )
+                self.use_counts[q_idx] = use_count
+                self.correct_percentages[q_idx] = correct_percentage
+                continue
+            self.all_topics.append(topic)
+            self.use_counts.append(use_count)
+            self.correct_percentages.append(correct_percentage)
+            self.topic_index[normalize_topic(topic)] = q_idx
+            if self.leaderboard is not None:
+                self.leaderboard.update(q_idx, None, (use_count, correct_percentage))
+        self.topic_aliases.update(aliases)
+        if rows and self.version >= 0:
+            store_logger.info("Refresh (%d) changed quizzes up to version (%d)", len(rows), version)
+        self.version = version
+        return len(rows)
+
+    @timed("record_data")
     def record_data(self, is_new_quiz: bool, q_idx: int, topic: str, data: dict[str, any]) -> None:
-        if not is_new_quiz and self.all_quizzes[q_idx]["use_count"] < 10:
-            data["all_score"] += self.all_quizzes[q_idx]["all_score"]
-            data["use_count"] = self.all_quizzes[q_idx]["use_count"] + 1
-            data["correct_percentage"] = round(100 * sum(data["all_score"]) /(5 * data["use_count"]), 3)
-            self.my_data["all_quizzes"][q_idx] = data
-        else:
-            data["correct_percentage"] = round(100 * data["all_score"][0] /5, 3)
-            self.my_data["all_quizzes"].append(data)
-            self.my_data["all_topics"].append(topic)
+        self.store.record_scores(is_new_quiz, q_idx, data)
+        self.refresh()
 
-        with open(DATA_PATH, "w") as file:
-            json.dump(self.my_data, file, indent=4)
+    def add_quizzes(self, quizzes: list[dict[str, any]], aliases: dict[str, str]) -> None:
+        self.store.add_quizzes(quizzes, aliases)
+        self.refresh()
 
-    def get_data(self) -> dict[str, any]:
-        with open(DATA_PATH, "r") as file:
-            return json.load(file)
+    def replace_quiz(self, q_idx: int, quiz: dict[str, any]) -> int | None:
+        new_idx = self.store.replace_quiz(q_idx, quiz)
+        # The topic index maps each topic to its newest row, so refresh swaps the replacement in.
+        self.refresh()
+        return new_idx
 
-class MistralAI:
+class Quiz_parser:
     def __init__(self) -> None:
-        self.model = MODEL
-        self.client = CLIENT
+        self.lock = threading.Lock()
+        self.text = ""
+        self.buffer = ""
+        self.topic = None
+        self.questions = []
+        self.choices = []
+        self.correct_answers = []
+        self.finished = False
+        self.cancelled = False
+
+    @timed("parse")
+    def feed(self, chunk: str) -> None:
+        with self.lock:
+            self.text += chunk
+            self.buffer += chunk
+            # The tail may end mid-delimiter ("...[") so it waits for the next chunk.
+            *segments, self.buffer = self.buffer.split("[]")
+            for segment in segments:
+                self.add_segment(segment)
+
+    def add_segment(self, segment: str) -> None:
+        segment = segment.strip()
+        if self.topic is None:
+            self.topic = segment.lower()
+        elif len(self.questions) < 5:
+            parts = segment.split("///")
+            if len(parts) != 2:
+                raise ValueError(f"Expected question///choices, got: {segment[:80]!r}")
+            choices = [choice.strip() for choice in parts[1].split("..")]
+            # The screens draw exactly four answer boxes.
+            if len(choices) != 4:
+                raise ValueError(f"Expected 4 choices, got {len(choices)} in: {segment[:80]!r}")
+            self.choices.append(choices)
+            self.questions.append(parts[0].strip())
+        elif segment:
+            self.buffer = segment + self.buffer
+
+    @timed("parse")
+    def close(self) -> None:
+        with self.lock:
+            correct_answers = [answer.strip() for answer in self.buffer.split("..")]
+            if len(self.questions) != 5 or len(correct_answers) != 5:
+                raise ValueError(f"Expected 5 questions and 5 answers, got {len(self.questions)} and {len(correct_answers)}")
+            for answer in correct_answers:
+                if answer not in ("1", "2", "3", "4"):
+                    raise ValueError(f"Invalid correct answer: {answer}")
+            self.correct_answers = correct_answers
+            self.buffer = ""
+            self.finished = True
+
+    def ready(self) -> int:
+        with self.lock:
+            return len(self.questions)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+class Quiz_generator(ABC):
+    name = "generator"
+
+    def __init__(self, model: str) -> None:
+        self.model = model
         with open(PROMPT_PATH, "r") as file:
             self.prompt = file.read()
 
+    def build_prompt(self, topic: str, old_topic: list) -> str:
+        return self.prompt + f"\nOLD TOPIC: {old_topic}" + "\nUSER PROMPT:" + topic
+
+    @abstractmethod
+    def complete(self, prompt: str) -> str:
+        ...
+
+    def chunks(self, prompt: str) -> Iterator[str]:
+        yield self.complete(prompt)
+
+    def generate_for(self, quizzes_data: "Quizzes_data", topic: str, parser: Quiz_parser) -> str:
+        # Runs on a worker thread, where picking the old topics may first index new topics.
+        return self.generate(topic, quizzes_data.nearest_topics(topic), parser)
+
+    @timed("llm_call")
     def call(self, topic: str, old_topic: list) -> str:
-        full_prompt = self.prompt + f"\nOLD TOPIC: {old_topic}" + "\nUSER PROMPT:" + topic
         try:
-            response = self.client.chat.complete(
-                model = self.model,
-                messages = [
-                    {
-                        "role": "user",
-                        "content": full_prompt,
-                    },
-                ]
-            )
-            return response.choices[0].message.content
+            return self.complete(self.build_prompt(topic, old_topic))
         except Exception as error:
-            print(f"Error calling Mistral API: {error}")
+            llm_logger.warning("Error calling (%s) on topic: (%s): (%s)", self.name, topic, error)
             return
 
+    @timed("llm_stream")
+    def stream(self, topic: str, old_topic: list, parser: Quiz_parser) -> str:
+        try:
+            for content in self.chunks(self.build_prompt(topic, old_topic)):
+                if parser.cancelled:
+                    return
+                parser.feed(content)
+        except ValueError as error:
+            llm_logger.warning("Error parsing (%s) stream on topic: (%s): (%s)", self.name, topic, error)
+            return
+        except Exception as error:
+            llm_logger.warning("Error calling (%s) on topic: (%s): (%s)", self.name, topic, error)
+            return
+        parser.close()
+        return parser.text
+
+    def generate(self, topic: str, old_topic: list, parser: Quiz_parser) -> str:
+        if STREAM_QUIZ:
+            return self.stream(topic, old_topic, parser)
+        response = self.call(topic, old_topic)
+        if response is not None:
+            parser.feed(response)
+            parser.close()
+        return response
+
+class MistralAI(Quiz_generator):
+    name = "MistralAI"
+
+    def __init__(self, model: str = MODEL) -> None:
+        super().__init__(model)
+
+    def messages(self, prompt: str) -> list[dict[str, str]]:
+        return [
+            {
+                "role": "user",
+                "content": prompt,
+            },
+        ]
+
+    def complete(self, prompt: str) -> str:
+        response = get_client().chat.complete(
+            model = self.model,
+            messages = self.messages(prompt),
+            timeout_ms = int(GENERATE_TIMEOUT * 1000)
+        )
+        return response.choices[0].message.content
+
+    def chunks(self, prompt: str) -> Iterator[str]:
+        with get_client().chat.stream(
+            model = self.model,
+            messages = self.messages(prompt),
+            timeout_ms = int(GENERATE_TIMEOUT * 1000)
+        ) as events:
+            for event in events:
+                content = event.data.choices[0].delta.content
+                if isinstance(content, str):
+                    yield content
+
+class OpenAI_compatible(Quiz_generator):
+    name = "OpenAI-compatible"
+
+    def __init__(self, base_url: str = GENERATOR_URL, model: str = GENERATOR_MODEL, api_key: str = GENERATOR_API_KEY) -> None:
+        super().__init__(model)
+        url = urllib.parse.urlsplit(base_url)
+        self.https = url.scheme == "https"
+        self.netloc = url.netloc
+        self.path = url.path.rstrip("/") + "/chat/completions"
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        # One keep-alive connection per worker thread, reused across requests.
+        self.connections = threading.local()
+
+    def connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self.connections, "conn", None)
+        if conn is None:
+            connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self.connections.conn = connection_class(self.netloc, timeout=GENERATE_TIMEOUT)
+        return conn
+
+    def drop_connection(self) -> None:
+        conn = getattr(self.connections, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.connections.conn = None
+
+    def request(self, prompt: str, stream: bool) -> http.client.HTTPResponse:
+        body = json.dumps({
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream
+        })
+        # A pooled connection the server has since closed fails once; retry on a fresh one.
+        for attempt in range(2):
+            try:
+                conn = self.connection()
+                conn.request("POST", self.path, body, self.headers)
+                response = conn.getresponse()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.drop_connection()
+                if attempt:
+                    raise
+            except BaseException:
+                # Anything else, a timeout above all, leaves the connection mid-request for good.
+                self.drop_connection()
+                raise
+        if response.status != 200:
+            detail = response.read()[:200]
+            self.drop_connection()
+            raise ConnectionError(f"HTTP {response.status}: {detail!r}")
+        return response
+
+    def complete(self, prompt: str) -> str:
+        response = self.request(prompt, False)
+        try:
+            body = response.read()
+        except BaseException:
+            self.drop_connection()
+            raise
+        return json.loads(body)["choices"][0]["message"]["content"]
+
+    def chunks(self, prompt: str) -> Iterator[str]:
+        response = self.request(prompt, True)
+        finished = False
+        try:
+            for line in response:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    response.read()
+                    finished = True
+                    break
+                content = json.loads(data)["choices"][0]["delta"].get("content")
+                if isinstance(content, str):
+                    yield content
+        finally:
+            # A half-read or failed response cannot be followed by another request on the same connection.
+            if not finished:
+                self.drop_connection()
+
+class Fixture_generator(Quiz_generator):
+    name = "fixture"
+
+    def __init__(self, delay: float = FIXTURE_DELAY) -> None:
+        super().__init__("fixture")
+        self.delay = delay
+
+    def complete(self, prompt: str) -> str:
+        time.sleep(self.delay)
+        return fixture_response(prompt)
+
+class Wrapped_generator(Quiz_generator):
+    # Sends the same prompts as the generator it wraps, and falls back to it.
+    def __init__(self, backend: Quiz_generator) -> None:
+        self.backend = backend
+        self.model = backend.model
+        self.prompt = backend.prompt
+        self.name = backend.name
+
+    def complete(self, prompt: str) -> str:
+        return self.backend.complete(prompt)
+
+    def chunks(self, prompt: str) -> Iterator[str]:
+        return self.backend.chunks(prompt)
+
+class Cached_generator(Wrapped_generator):
+    # Responses are stored by a hash of (model, prompt); only answers that parsed are kept.
+    def __init__(self, backend: Quiz_generator, cache_dir: str = RESPONSE_CACHE) -> None:
+        super().__init__(backend)
+        self.cache_dir = cache_dir
+
+    def path(self, prompt: str) -> str:
+        digest = hashlib.sha256(f"{self.model}\0{prompt}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".txt")
+
+    @timed("llm_cache_hit")
+    def read(self, path: str) -> str | None:
+        try:
+            with open(path, "r") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+        except OSError as error:
+            # An unreadable cache is only a miss; the backend still answers.
+            llm_logger.warning("Cannot read cached response: (%s): (%s)", path, error)
+            return None
+
+    def write(self, path: str, response: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + f".{threading.get_ident()}.tmp", "w") as file:
+                file.write(response)
+            os.replace(path + f".{threading.get_ident()}.tmp", path)
+        except OSError as error:
+            # The player already has the quiz; only the next run pays for the lost entry.
+            llm_logger.warning("Cannot cache response: (%s): (%s)", path, error)
+
+    def generate(self, topic: str, old_topic: list, parser: Quiz_parser) -> str:
+        path = self.path(self.build_prompt(topic, old_topic))
+        response = self.read(path)
+        if response is not None:
+            parser.feed(response)
+            parser.close()
+            return response
+        response = self.backend.generate(topic, old_topic, parser)
+        if response is not None and parser.finished:
+            self.write(path, response)
+        return response
+
+
+def fixture_response(prompt: str) -> str:
+    # Same topic, same quiz: the answers come from a hash of the topic.
+    topic = prompt.rsplit("USER PROMPT:", 1)[-1].strip()
+    digest = hashlib.sha256(topic.encode()).digest()
+    segments = [normalize_topic(topic) or "fixture"]
+    for q in range(5):
+        choices = "..".join(f"{topic} choice {c}" for c in range(1, 5))
+        segments.append(f"Question {q + 1} about {topic}?///{choices}")
+    answers = "..".join(str(digest[q] % 4 + 1) for q in range(5))
+    return "[]".join(segments) + "[]" + answers
+
+def make_generator() -> Quiz_generator:
+    if GENERATOR == "openai":
+        generator = OpenAI_compatible()
+    elif GENERATOR == "fixture":
+        generator = Fixture_generator()
+    else:
+        generator = MistralAI()
+    if RESPONSE_CACHE:
+        generator = Cached_generator(generator)
+    return generator
+
+class Text_cache:
+    def __init__(self, max_bytes: int = TEXT_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def size_of(value: any) -> int:
+        if isinstance(value, pygame.Surface):
+            return value.get_width() * value.get_height() * value.get_bytesize()
+        if isinstance(value, tuple) and value and isinstance(value[0], pygame.Surface):
+            return Text_cache.size_of(value[0])
+        return 64 * (len(value) + 1) if isinstance(value, list) else 64
+
+    def get(self, key: tuple, build: callable) -> any:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        value = build()
+        self.entries[key] = value
+        self.size += self.size_of(value)
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, old_value = self.entries.popitem(last=False)
+            self.size -= self.size_of(old_value)
+        return value
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
 class GameStage(Enum):
     NAME = "name"
     TOPIC = "topic"
     GENERATE_QUIZ = "generate_quiz"
+    GENERATE_FAILED = "generate_failed"
     QUIZ = "quiz"
     CORRECT = "correct_answer"
     INCORRECT = "incorrect_answer"
@@ -145,12 +1174,165 @@ class GameStage(Enum):
     PERFORMANCE = "performance"
     PLOT = "plot"
 
-class Gameplay:
+class Action(Enum):
+    TYPE = "type"
+    BACKSPACE = "backspace"
+    ENTER = "enter"
+    ESCAPE = "escape"
+    CHOOSE = "choose"
+    CONTINUE = "continue"
+    LEADERBOARD = "leaderboard"
+    PERFORMANCE = "performance"
+    PLOT = "plot"
+    QUIT = "quit"
+
+class Daemon_executor(Executor):
+    # ThreadPoolExecutor workers are joined at exit, so quitting would wait for a running
+    # LLM call to return; these workers are daemons and die with the process.
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max_workers
+        self.jobs = queue.SimpleQueue()
+        self.threads = []
+        self.closed = False
+
+    def submit(self, function, *args, **kwargs) -> Future:
+        if self.closed:
+            raise RuntimeError("cannot submit after shutdown")
+        future = Future()
+        self.jobs.put((future, function, args, kwargs))
+        if len(self.threads) < self.max_workers:
+            thread = threading.Thread(target=self.work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return future
+
+    def work(self) -> None:
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            future, function, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args, **kwargs))
+            except BaseException as error:
+                future.set_exception(error)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self.closed = True
+        if cancel_futures:
+            while True:
+                try:
+                    job = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None:
+                    job[0].cancel()
+        for _ in self.threads:
+            self.jobs.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+class Generation_job:
+    def __init__(self, topic: str, future: Future, parser: Quiz_parser, tokens: int = 0) -> None:
+        self.topic = topic
+        self.future = future
+        self.parser = parser
+        self.tokens = tokens
+        self.topic_checked = False
+        self.started = time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+class Prefetch_stats:
     def __init__(self) -> None:
-        self.quizzes_data = Quizzes_data()
-        self.mistral_ai = MistralAI()
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+        self.wasted_tokens = 0
+
+    def record(self, outcome: str, job: Generation_job) -> None:
+        if outcome == "hit":
+            self.hits += 1
+        else:
+            self.wasted += 1
+            self.wasted_tokens += job.tokens
+        llm_logger.info(
+            "Prefetch %s on: (%s), hit rate: %.1f%% (%d/%d), wasted: (%d) calls, ~(%d) tokens",
+            outcome, job.topic, 100 * self.hits / max(self.started, 1), self.hits, self.started,
+            self.wasted, self.wasted_tokens
+        )
+        log_event("prefetch", outcome=outcome, topic=job.topic, seconds=round(job.elapsed(), 3))
+
+PREFETCH_STATS = Prefetch_stats()
+
+class Quiz_refresher:
+    # Stale-while-revalidate: a quiz a few uses short of REUSE_LIMIT gets its replacement
+    # generated in the background, so no player waits for the one that runs out.
+    def __init__(self, quizzes_data: Quizzes_data, generator: Quiz_generator) -> None:
+        self.quizzes_data = quizzes_data
+        self.generator = generator
+        self.executor = Daemon_executor(max_workers=1)
+        self.pending = {}
+
+    def check(self, q_idx: int) -> None:
+        quizzes_data = self.quizzes_data
+        topic = quizzes_data.all_topics[q_idx]
+        if (REFRESH_AHEAD <= 0 or q_idx in self.pending
+                or quizzes_data.use_counts[q_idx] < REUSE_LIMIT - REFRESH_AHEAD
+                or quizzes_data.topic_index.get(normalize_topic(topic)) != q_idx):
+            return
+        parser = Quiz_parser()
+        future = self.executor.submit(self.generator.generate_for, quizzes_data, topic, parser)
+        self.pending[q_idx] = Generation_job(topic, future, parser)
+        llm_logger.info("Refresh quizzes on topic: (%s) at (%d) uses", topic, quizzes_data.use_counts[q_idx])
+
+    def finished(self) -> list[tuple[int, Generation_job, dict[str, any]]]:
+        done = []
+        for q_idx, job in list(self.pending.items()):
+            if not job.future.done():
+                continue
+            del self.pending[q_idx]
+            if job.future.exception() is not None or job.future.result() is None or not job.parser.finished:
+                llm_logger.warning("Cannot refresh quizzes on topic: (%s)", job.topic)
+                continue
+            done.append((q_idx, job, {
+                # Kept under the old topic even if the model renamed it, so lookups find it.
+                "topic": job.topic,
+                "questions": job.parser.questions,
+                "choices": job.parser.choices,
+                "correct_answers": job.parser.correct_answers,
+                "use_count": 0,
+                "all_score": [],
+                "correct_percentage": 0
+            }))
+        return done
+
+    def swapped(self, q_idx: int, job: Generation_job, new_idx: int | None) -> None:
+        llm_logger.info("Swap in quizzes on topic: (%s) after %.1fs, (%s) retired", job.topic, job.elapsed(), q_idx)
+        log_event("refreshed", topic=job.topic, seconds=round(job.elapsed(), 3), replaced=new_idx is not None)
+
+    def poll(self) -> None:
+        # Runs on the thread that owns the store connection.
+        for q_idx, job, quiz in self.finished():
+            self.swapped(q_idx, job, self.quizzes_data.replace_quiz(q_idx, quiz))
+
+    def close(self) -> None:
+        for job in self.pending.values():
+            job.parser.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class Game_engine:
+    def __init__(self, quizzes_data: Quizzes_data | None = None, generator: Quiz_generator | None = None) -> None:
+        self.quizzes_data = quizzes_data if quizzes_data is not None else Quizzes_data()
+        self.quizzes_data.start_indexing()
+        self.mistral_ai = generator if generator is not None else make_generator()
         self.player = Player()
         self.stage = GameStage.NAME
+        self.return_stage = GameStage.NAME
         self.questions = []
         self.choices = []
         self.correct_answers = []
@@ -158,119 +1340,466 @@ class Gameplay:
         self.q_number = 0
         self.is_new_quiz = True
         self.q_idx = 0
-        self.setup_display()
-
-    def setup_display(self) -> None:
-        self.clock = pygame.time.Clock()
-        self.font = pygame.font.SysFont(None, 30)
-        self.medium_font = pygame.font.SysFont(None, 60)
-        self.big_font = pygame.font.SysFont(None, 100)
-        self.surface = pygame.display.set_mode((SURFACE_WIDHT,SURFACE_HEIGHT))
+        self.pending_answer = None
+        self.shown_question = None
+        self.question_shown = 0.0
+        # One slot per question (choice 0 is unanswered), stored as-is for analytics.py.
+        self.answer_choices = array("b", bytes(5))
+        self.answer_seconds = array("f", bytes(20))
+        # One worker for the real generation, the rest for speculative ones.
+        self.executor = Daemon_executor(max_workers=1 + PREFETCH_LIMIT)
+        self.generation = None
+        self.prefetch = None
+        self.prefetches = []
+        self.prefetch_tokens = 0
+        self.typed_at = None
+        self.topic_entered = 0.0
+        self.refresher = Quiz_refresher(self.quizzes_data, self.mistral_ai)
 
     def use_exist_quiz(self) -> None:
-        self.questions = self.quizzes_data.all_quizzes[self.q_idx]["questions"]
-        self.choices = self.quizzes_data.all_quizzes[self.q_idx]["choices"]
-        self.correct_answers = self.quizzes_data.all_quizzes[self.q_idx]["correct_answers"]
-
-    def extract_response(self, response: str) -> None:
-        response = response.split('[]')
-        self.topic = response[0].lower()
-
-        if self.topic in [t.lower() for t in self.quizzes_data.all_topics]:
+        quiz = self.quizzes_data.quiz(self.q_idx)
+        self.questions = quiz["questions"]
+        self.choices = quiz["choices"]
+        self.correct_answers = quiz["correct_answers"]
+
+    def check_topic(self, topic: str) -> bool:
+        self.topic = topic
+        q_idx = self.quizzes_data.topic_index.get(normalize_topic(self.topic))
+        if q_idx is not None:
             self.is_new_quiz = False
-            self.q_idx = self.quizzes_data.all_topics.index(self.topic)
-        if not self.is_new_quiz and self.quizzes_data.all_quizzes[self.q_idx]["use_count"] < 10:
+            self.q_idx = q_idx
+        if not self.is_new_quiz and self.quizzes_data.use_counts[self.q_idx] < REUSE_LIMIT:
             self.use_exist_quiz()
             logger.info(
                 "Use old quizzes on topic: (%s)",
                 self.topic
             )
-        else:
-            self.correct_answers = response[6].split('..')
-            tmp_questions = response[1:6]
+            return True
+        logger.info(
+            "generating new quizzes on topic: (%s)",
+            self.topic
+        )
+        return False
+
+    def use_cached_topic(self) -> bool:
+        q_idx = self.quizzes_data.resolve_topic(self.player.topic)
+        if q_idx is None:
+            return False
+        self.is_new_quiz = False
+        self.q_idx = q_idx
+        self.topic = self.quizzes_data.all_topics[q_idx]
+        self.use_exist_quiz()
+        logger.info(
+            "Use old quizzes on topic: (%s) without calling the generator",
+            self.topic
+        )
+        return True
+
+    def submit_generation(self, topic: str) -> Generation_job:
+        parser = Quiz_parser()
+        # A rough estimate (4 characters per token, old topics about as long as this one)
+        # is enough to keep speculation on a budget.
+        tokens = len(self.mistral_ai.build_prompt(topic, [topic] * PROMPT_TOPIC_LIMIT)) // 4 + PREFETCH_RESPONSE_TOKENS
+        future = self.executor.submit(self.mistral_ai.generate_for, self.quizzes_data, topic, parser)
+        return Generation_job(topic, future, parser, tokens)
+
+    def start_generation(self) -> None:
+        self.generation = self.submit_generation(self.player.topic)
+        llm_logger.info(
+            "Start generating quizzes on topic: (%s)",
+            self.player.topic
+        )
 
-            for qt in tmp_questions:
-                question, answer = qt.split('///')
-                self.questions.append(question)
-                self.choices.append(answer.split('..'))
-            logger.info(
-                "generating new quizzes on topic: (%s)",
-                self.topic
-            )
+    def cancel_generation(self) -> None:
+        if self.generation is None:
+            return
+        # A running call cannot be interrupted, a stream stops at its next chunk.
+        self.generation.future.cancel()
+        self.generation.parser.cancel()
+        llm_logger.info(
+            "Cancel generating quizzes on topic: (%s) after %.1fs",
+            self.generation.topic, self.generation.elapsed()
+        )
+        self.generation = None
+
+    def prefetch_due(self) -> float | None:
+        if self.typed_at is None or PREFETCH_DELAY <= 0 or self.stage != GameStage.TOPIC:
+            return None
+        return max(0.0, self.typed_at + PREFETCH_DELAY - time.monotonic())
+
+    def start_prefetch(self) -> None:
+        # Typing paused: start on the partial topic so Enter finds the quiz under way.
+        self.typed_at = None
+        topic = self.player.topic
+        key = normalize_topic(topic)
+        if self.prefetch is not None and normalize_topic(self.prefetch.topic) == key:
+            return
+        self.discard_prefetch()
+        if not key:
+            return
+        q_idx = self.quizzes_data.lookup_topic(topic)
+        if q_idx is not None:
+            # A stored quiz needs no generation; just have its questions ready.
+            self.quizzes_data.quiz(q_idx)
+            return
+        self.prefetches = [job for job in self.prefetches if not job.future.done()]
+        if self.prefetch_tokens >= PREFETCH_TOKEN_BUDGET:
+            llm_logger.debug("Skip prefetch on: (%s), ~(%d) tokens spent", topic, self.prefetch_tokens)
+            return
+        if len(self.prefetches) >= PREFETCH_LIMIT:
+            # Discarded calls still hold their slot until they return; look again shortly.
+            self.typed_at = time.monotonic() - PREFETCH_DELAY + 0.1
+            return
+        self.prefetch = self.submit_generation(topic)
+        self.prefetches.append(self.prefetch)
+        self.prefetch_tokens += self.prefetch.tokens
+        PREFETCH_STATS.started += 1
+        llm_logger.info("Prefetch quizzes on topic: (%s)", topic)
+
+    def discard_prefetch(self) -> None:
+        job = self.prefetch
+        if job is None:
+            return
+        self.prefetch = None
+        job.parser.cancel()
+        if job.future.cancel():
+            # Never started, so nothing was spent.
+            self.prefetch_tokens -= job.tokens
+            job.tokens = 0
+        PREFETCH_STATS.record("wasted", job)
+
+    def adopt_prefetch(self) -> bool:
+        job = self.prefetch
+        if job is None:
+            return False
+        if normalize_topic(job.topic) != normalize_topic(self.player.topic) or (
+                job.future.done() and (job.future.exception() is not None or job.future.result() is None)):
+            self.discard_prefetch()
+            return False
+        self.prefetch = None
+        # The call would have been made after Enter anyway, so it is not charged to speculation.
+        self.prefetch_tokens -= job.tokens
+        PREFETCH_STATS.record("hit", job)
+        self.generation = job
+        return True
+
+    def fail_generation(self) -> None:
+        self.cancel_generation()
+        self.reset_quiz()
+        self.player.score = 0
+        self.stage = GameStage.GENERATE_FAILED
+
+    def poll_generation(self) -> None:
+        if self.generation is None:
+            # Another game on the same store may already have made quizzes on this topic.
+            self.quizzes_data.refresh()
+            if self.use_cached_topic():
+                self.discard_prefetch()
+                self.stage = GameStage.QUIZ
+                return
+            if not self.adopt_prefetch():
+                self.start_generation()
+                return
+
+        job = self.generation
+        if not job.topic_checked and job.parser.topic is not None:
+            job.topic_checked = True
+            if self.check_topic(job.parser.topic):
+                self.quizzes_data.learn_alias(job.topic, self.topic)
+                self.cancel_generation()
+                self.stage = GameStage.QUIZ
+                return
+        if self.stage == GameStage.GENERATE_QUIZ and job.topic_checked and job.parser.ready() > 0:
+            # Questions keep arriving in the same lists while the quiz is played.
+            self.questions = job.parser.questions
+            self.choices = job.parser.choices
+            self.stage = GameStage.QUIZ
+            METRICS.record("first_question", time.monotonic() - self.topic_entered)
+
+        if not job.future.done():
+            if job.elapsed() > GENERATE_TIMEOUT:
+                llm_logger.warning(
+                    "Generating quizzes on topic: (%s) timed out",
+                    job.topic
+                )
+                self.fail_generation()
+            return
 
-    def handle_name_input(self, event: pygame.event.Event) -> None:
-        if event.key == pygame.K_BACKSPACE:
+        self.generation = None
+        try:
+            response = job.future.result()
+        except ValueError:
+            response = None
+        if response is None or not job.parser.finished:
+            llm_logger.warning("Cannot extract quizzes on topic: (%s)", job.topic)
+            self.fail_generation()
+            return
+        llm_logger.debug(response)
+        log_event("generated", topic=job.topic, seconds=round(job.elapsed(), 3), chars=len(response))
+        self.questions = job.parser.questions
+        self.choices = job.parser.choices
+        self.correct_answers = job.parser.correct_answers
+        self.quizzes_data.learn_alias(job.topic, self.topic)
+        self.stage = GameStage.QUIZ
+
+    def handle(self, action: Action, value: any = None) -> None:
+        if action == Action.QUIT:
+            self.stage = GameStage.LEAVE
+
+        elif self.stage == GameStage.NAME:
+            self.handle_name_input(action, value)
+
+        elif self.stage == GameStage.TOPIC:
+            self.handle_topic_input(action, value)
+
+        elif self.stage in [GameStage.LEADERBOARD, GameStage.PERFORMANCE]:
+            if action == Action.ENTER:
+                self.stage = self.return_stage
+            elif action == Action.PLOT and self.stage == GameStage.PERFORMANCE:
+                self.stage = GameStage.PLOT
+
+        elif self.stage == GameStage.PLOT:
+            if action == Action.ENTER:
+                self.stage = GameStage.PERFORMANCE
+
+        elif self.stage in [GameStage.CORRECT, GameStage.INCORRECT]:
+            if action == Action.ENTER:
+                self.stage = GameStage.QUIZ
+                self.q_number += 1
+                self.show_question()
+
+        elif self.stage == GameStage.GENERATE_QUIZ:
+            if action == Action.ESCAPE:
+                self.cancel_generation()
+                self.stage = GameStage.TOPIC
+
+        elif self.stage == GameStage.QUIZ:
+            if action == Action.ESCAPE and self.generation is not None:
+                self.cancel_generation()
+                self.reset_quiz()
+                self.player.score = 0
+                self.stage = GameStage.TOPIC
+            elif action == Action.CHOOSE and self.pending_answer is None and self.q_number < len(self.questions):
+                self.choose(value)
+
+        elif self.stage == GameStage.GENERATE_FAILED:
+            if action == Action.ENTER:
+                self.stage = GameStage.TOPIC
+
+        elif self.stage == GameStage.END:
+            if action == Action.ENTER:
+                self.stage = GameStage.LEAVE
+            elif action == Action.CONTINUE:
+                self.stage = GameStage.TOPIC
+                self.player.score = 0
+                self.quizzes_data.refresh()
+                logger.info(
+                    "Player: (%s) continue the quizzes game",
+                    self.player.name
+                )
+
+    def handle_name_input(self, action: Action, value: any) -> None:
+        if action == Action.BACKSPACE:
             self.player.name = self.player.name[:-1]
-        elif event.key == pygame.K_RETURN:
-            print(f"User's name: {self.player.name}")
+        elif action == Action.ENTER:
             self.stage = GameStage.TOPIC
             logger.info("Player: (%s) play quizzes game.", self.player.name)
+        elif action == Action.TYPE:
+            self.player.name += value
         else:
-            self.player.name += event.unicode
+            self.open_board(action)
 
-    def handle_topic_input(self, event: pygame.event.Event) -> None:
-        if event.key == pygame.K_BACKSPACE:
+    def handle_topic_input(self, action: Action, value: any) -> None:
+        if action == Action.BACKSPACE:
             self.player.topic = self.player.topic[:-1]
-        elif event.key == pygame.K_RETURN:
-            print(f"Topic chosen: {self.player.topic}")
+            self.typed_at = time.monotonic()
+        elif action == Action.ENTER:
             self.stage = GameStage.GENERATE_QUIZ
+            self.typed_at = None
+            self.topic_entered = time.monotonic()
             logger.info("Player: (%s) choose topic: (%s)", self.player.name, self.player.topic)
+        elif action == Action.TYPE:
+            self.player.topic += value
+            self.typed_at = time.monotonic()
         else:
-            self.player.topic += event.unicode
+            self.open_board(action)
 
-    def handle_quiz_input(self, mouse_pos: tuple[int, int]) -> int:
-        x, y = mouse_pos
-        # print(mouse_pos)
-        if 400 < y < 600 and x < 500:
-            logger.info(
-                "Player: (%s) select choice: (%d) on question: (%d)",
-                self.player.name, 1, self.q_number+1
-            )
-            return 1
-        if 400 < y < 600 and 500 < x:
-            logger.info(
-                "Player: (%s) select choice: (%d) on question: (%d)", 
-                self.player.name, 2, self.q_number+1
-            )
-            return 2
-        if 600 < y < 800 and x < 500:
+    def open_board(self, action: Action) -> None:
+        if action == Action.LEADERBOARD:
+            self.quizzes_data.refresh()
+            self.return_stage = self.stage
+            self.stage = GameStage.LEADERBOARD
             logger.info(
-                "Player: (%s) select choice: (%d) on question: (%d)", 
-                self.player.name, 3, self.q_number+1
+                "Player (%s) see top 5 quizzes.",
+                self.player.name
             )
-            return 3
-        if 600 < y < 800 and 500 < x:
+        elif action == Action.PERFORMANCE:
+            self.return_stage = self.stage
+            self.stage = GameStage.PERFORMANCE
             logger.info(
-                "Player: (%s) select choice: (%d) on question: (%d)", 
-                self.player.name, 4, self.q_number + 1
+                "Player (%s) see performance of top 5 quizzes.",
+                self.player.name
             )
-            return 4
+
+    def show_question(self) -> None:
+        # Response times run from the first frame the question is on screen.
+        if self.shown_question != self.q_number and self.q_number < len(self.questions):
+            self.shown_question = self.q_number
+            self.question_shown = time.monotonic()
+
+    def choose(self, answer: int) -> None:
+        self.answer_choices[self.q_number] = answer
+        self.answer_seconds[self.q_number] = time.monotonic() - self.question_shown
+        log_event(
+            "select_choice", player=self.player.name, topic=self.topic,
+            question=self.q_number + 1, choice=answer
+        )
+        if self.correct_answers:
+            self.check_answer(answer)
+        else:
+            # The answer key arrives last when streaming; step() checks it then.
+            self.pending_answer = answer
 
     def check_answer(self, answer: int) -> None:
-        if answer == int(self.correct_answers[self.q_number]):
+        correct = answer == int(self.correct_answers[self.q_number])
+        if correct:
             self.player.score += 1
             self.stage = GameStage.CORRECT
-            logger.info(
-                "Player: (%s) get a correct answer on question: (%d)",
-                self.player.name, self.q_number + 1
-            )
         else:
             self.stage = GameStage.INCORRECT
-            logger.info(
-                "Player: (%s) get an incorrect answer on question: (%d)",
-                self.player.name, self.q_number + 1
-            )
+        log_event(
+            "answer", player=self.player.name, topic=self.topic,
+            question=self.q_number + 1, choice=answer, correct=correct
+        )
+
+    def make_json(self) -> dict[str, any]:
+        data = {
+            "topic": self.topic,
+            "questions": self.questions,
+            "choices": self.choices,
+            "correct_answers": self.correct_answers,
+            "use_count": 1,
+            "all_score": [self.player.score],
+            "all_answers": [(self.answer_choices.tobytes(), self.answer_seconds.tobytes())],
+            "correct_percentage": 0
+        }
+        return data
+
+    def reset_quiz(self) -> None:
+        self.choices = []
+        self.questions = []
+        self.q_number = 0
+        self.correct_answers = []
+        self.is_new_quiz = True
+        self.pending_answer = None
+        self.shown_question = None
+        self.answer_choices = array("b", bytes(5))
+        self.answer_seconds = array("f", bytes(20))
 
-    def show_correct_interface(self) -> None:
-        self.draw_text(self.big_font, "CORRECT!", BLACK, 320, 330)
-        self.draw_text(self.font, "PRESS-ENTER TO CONTINUE", BLACK, 360, 470)
+    def update(self) -> None:
+        data = self.make_json()
+        self.quizzes_data.record_data(self.is_new_quiz, self.q_idx, self.topic, data)
+        if not self.is_new_quiz:
+            self.refresher.check(self.q_idx)
+        self.reset_quiz()
+        # PREFETCH_TOKEN_BUDGET caps speculation per game, not per process.
+        self.prefetch_tokens = 0
+        self.stage = GameStage.END
+        logger.info(
+            "Player: (%s) finish quizzes on topic: (%s) with score: (%d)",
+            self.player.name, self.topic, self.player.score
+        )
+        log_event("finish", player=self.player.name, topic=self.topic, score=self.player.score)
+
+    def step(self) -> None:
+        if self.refresher.pending:
+            self.refresher.poll()
+        if self.prefetch_due() == 0:
+            self.start_prefetch()
+        if self.stage == GameStage.GENERATE_QUIZ or (self.stage == GameStage.QUIZ and self.generation is not None):
+            self.poll_generation()
+        if self.stage == GameStage.QUIZ:
+            self.show_question()
+            if self.q_number >= 5:
+                self.stage = GameStage.UPDATE
+            elif self.pending_answer is not None and self.correct_answers:
+                self.check_answer(self.pending_answer)
+                self.pending_answer = None
+        if self.stage == GameStage.UPDATE:
+            self.update()
+
+    def close(self) -> None:
+        self.discard_prefetch()
+        self.cancel_generation()
+        self.refresher.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class Gameplay(Game_engine):
+    def __init__(self, quizzes_data: Quizzes_data | None = None, generator: Quiz_generator | None = None) -> None:
+        super().__init__(quizzes_data, generator)
+        self.setup_display()
+
+    def setup_display(self) -> None:
+        self.clock = pygame.time.Clock()
+        self.font = pygame.font.SysFont(None, 30)
+        # The other fonts and screens are loaded while the NAME screen idles.
+        self.medium_font = None
+        self.big_font = None
+        self.small_font = None
+        self.surface = pygame.display.set_mode((SURFACE_WIDHT,SURFACE_HEIGHT))
+        self.text_cache = Text_cache()
+        self.frame_rects = []
+        self.shown_rects = []
+        self.shown_scene = None
+        self.backgrounds = {}
+        self.plot_cache = {}
+        self.plot_surface = None
+        self.plot_stats = []
+        self.show_metrics = DEBUG_OVERLAY
+
+    def handle_quiz_input(self, mouse_pos: tuple[int, int]) -> int:
+        x, y = mouse_pos
+        # print(mouse_pos)
+        if 400 < y < 600 and x < 500:
+            return 1
+        if 400 < y < 600 and 500 < x:
+            return 2
+        if 600 < y < 800 and x < 500:
+            return 3
+        if 600 < y < 800 and 500 < x:
+            return 4
 
     def show_incorrect_interface(self) -> None:
-        self.draw_text(self.big_font, "INCORRECT!", BLACK, 300, 330)
         correct_choice = int(self.correct_answers[self.q_number]) - 1
         text = f"Correct answer is: {self.choices[self.q_number][correct_choice]}"
         self.draw_text(self.font, text, RED, 300, 400, 740, 600)
-        self.draw_text(self.font, "PRESS-ENTER TO CONTINUE", BLACK, 360, 500)
+
+    def show_loading(self) -> None:
+        ticks = pygame.time.get_ticks()
+        dots = "." * (ticks // 400 % 4)
+        self.draw_text(self.font, f"generating quizzes, please wait{dots}", RED, 50, 50)
+        self.draw_text(self.font, f"Topic: {self.player.topic}", RED, 50, 80)
+        self.draw_rotated_square(self.surface, BLUE, (500, 400), 80, ticks / 5 % 360)
+        if self.generation is not None:
+            self.draw_text(self.font, f"{self.generation.elapsed():.0f}s", BLACK, 485, 480)
+
+    def show_generate_failed(self) -> None:
+        self.draw_text(self.font, f"Topic: {self.player.topic}", RED, 50, 120)
+
+    def show_metrics_overlay(self) -> None:
+        # Values change every frame, so the rows bypass the text cache.
+        self.load_fonts()
+        rows = ["p50 / p95 / p99 ms"] + [
+            f"{name} {stage}  {1000 * p50:.1f} / {1000 * p95:.1f} / {1000 * p99:.1f}  n={count}"
+            for name, stage, count, _, p50, p95, p99 in METRICS.summary()
+        ]
+        lines = [self.small_font.render(row, True, WHITE) for row in rows]
+        width = max(line.get_width() for line in lines) + 20
+        rect = pygame.Rect(SURFACE_WIDHT - width, 0, width, 20 * len(lines) + 10)
+        pygame.draw.rect(self.surface, BLACK, rect)
+        for row, line in enumerate(lines):
+            self.surface.blit(line, (rect.x + 10, 5 + 20 * row))
+        self.frame_rects.append(rect)
 
     def draw_rotated_square(self,
                             surface: pygame.Surface,
@@ -282,7 +1811,7 @@ class Gameplay:
         pygame.draw.rect(square_surface, color, (0, 0, size, size)) 
         rotated_square = pygame.transform.rotate(square_surface, angle)
         rect = rotated_square.get_rect(center=center)
-        surface.blit(rotated_square, rect.topleft)
+        self.frame_rects.append(surface.blit(rotated_square, rect.topleft))
 
     def draw_text(self, font: pygame.font.Font,
                   text: str,
@@ -293,40 +1822,82 @@ class Gameplay:
                   y2: int=0,
                   is_choice: bool=False) -> None:
         if x2 == 0 and y2 == 0:
-            img = font.render(text, True, color)
-            self.surface.blit(img, (x1, y1))
+            img = self.text_cache.get(
+                ("line", font, text, color),
+                lambda: font.render(text, True, color)
+            )
+            self.frame_rects.append(self.surface.blit(img, (x1, y1)))
         else:
-            words = text.split(' ')
-            space_width = font.size(' ')[0]  # Width of a space character
-            if is_choice:
-                max_width = x2 - x1
-                total_width = 0
-                for word in words:
-                    word_width, word_height = font.size(word)
-                    total_width += word_width
-                    total_width += space_width
-                total_width -= space_width 
-
-                lines = total_width / max_width
-                if 2 > lines > 1:
-                    y1 -= 10
-                elif 3 > lines > 2:
-                    y1 -= 20
-                elif lines > 3:
-                    y1 -= 30
-
-            x, y = x1, y1
-
+            block = self.text_cache.get(
+                ("block", font, text, color, x1, y1, x2, y2, is_choice),
+                lambda: self.render_text_block(font, text, color, x1, y1, x2, y2, is_choice)
+            )
+            if block is not None:
+                self.frame_rects.append(self.surface.blit(*block))
+
+    def layout_text(self, font: pygame.font.Font,
+                    text: str,
+                    x1: int,
+                    y1: int,
+                    x2: int,
+                    y2: int,
+                    is_choice: bool) -> list[tuple[str, int, int]]:
+        words = text.split(' ')
+        space_width = font.size(' ')[0]  # Width of a space character
+        if is_choice:
+            max_width = x2 - x1
+            total_width = 0
             for word in words:
                 word_width, word_height = font.size(word)
-                if x + word_width > x2:
-                    x = x1
-                    y += word_height
-                if y + word_height > y2:
-                    break
-                img = font.render(word, True, color)
-                self.surface.blit(img, (x, y))
-                x += word_width + space_width
+                total_width += word_width
+                total_width += space_width
+            total_width -= space_width 
+
+            lines = total_width / max_width
+            if 2 > lines > 1:
+                y1 -= 10
+            elif 3 > lines > 2:
+                y1 -= 20
+            elif lines > 3:
+                y1 -= 30
+
+        x, y = x1, y1
+        layout = []
+
+        for word in words:
+            word_width, word_height = font.size(word)
+            if x + word_width > x2:
+                x = x1
+                y += word_height
+            if y + word_height > y2:
+                break
+            layout.append((word, x, y))
+            x += word_width + space_width
+        return layout
+
+    def render_text_block(self, font: pygame.font.Font,
+                          text: str,
+                          color: tuple[int, int, int],
+                          x1: int,
+                          y1: int,
+                          x2: int,
+                          y2: int,
+                          is_choice: bool) -> tuple[pygame.Surface, tuple[int, int]] | None:
+        layout = self.layout_text(font, text, x1, y1, x2, y2, is_choice)
+        if not layout:
+            return
+        words = [(font.render(word, True, color), x, y) for word, x, y in layout]
+        left = min(x for _, x, _ in words)
+        top = min(y for _, _, y in words)
+        right = max(x + img.get_width() for img, x, _ in words)
+        bottom = max(y + img.get_height() for img, _, y in words)
+
+        # Transparent pixels keep the text color so antialiased edges blend once.
+        block = pygame.Surface((right - left, bottom - top), pygame.SRCALPHA)
+        block.fill((*color, 0))
+        for img, x, y in words:
+            block.blit(img, (x - left, y - top))
+        return block, (left, top)
 
     def draw_decorative(self) -> None:
         triangle_points = [(50, 470), (20, 530), (80, 530)]
@@ -335,15 +1906,82 @@ class Gameplay:
         pygame.draw.rect(self.surface, WHITE, pygame.Rect(520, 670, 60, 60))
         self.draw_rotated_square(self.surface, WHITE, (552, 500), 60, 45)
 
-    def draw_interface(self) -> None:
-        pygame.draw.rect(self.surface, LIGHT_PURPLE, pygame.Rect(0, 100, QUESTION_WIDTH, QUESTION_HEIGHT))
-        pygame.draw.rect(self.surface, RED, pygame.Rect(0, 400, RECT_WIDTH, RECT_HEIGHT))
-        pygame.draw.rect(self.surface, YELLOW, pygame.Rect(0, 600, RECT_WIDTH, RECT_HEIGHT))
-        pygame.draw.rect(self.surface, BLUE, pygame.Rect(500, 400, RECT_WIDTH, RECT_HEIGHT))
-        pygame.draw.rect(self.surface, GREEN, pygame.Rect(500, 600, RECT_WIDTH, RECT_HEIGHT))
+    def draw_background(self, stage: GameStage) -> None:
+        self.surface.fill(WHITE)
+        if stage == GameStage.NAME:
+            self.draw_text(self.font, "Welcome to the quiz game!", RED, 50, 50)
+            self.show_options()
 
-        self.draw_decorative()
+        elif stage == GameStage.TOPIC:
+            self.draw_text(self.font, "What topic do you want to quiz?", RED, 50, 80)
+            self.show_options()
 
+        elif stage == GameStage.LEADERBOARD:
+            self.draw_text(self.medium_font, "Top 5 Quality quiz!",BLUE, 100, 50)
+            self.draw_text(self.font, "PRESS-ENTER TO EXIT", BLACK, 360, 600)
+
+        elif stage == GameStage.PERFORMANCE:
+            self.draw_text(self.medium_font, "Select the quiz!",BLUE, 100, 50)
+            self.draw_text(self.font, "PRESS-ENTER TO EXIT", BLACK, 360, 600)
+
+        elif stage == GameStage.PLOT:
+            # Below the five question stat rows under the plot.
+            self.draw_text(self.font, "PRESS-ENTER TO EXIT", BLACK, 360, 720)
+
+        elif stage == GameStage.GENERATE_QUIZ:
+            self.draw_text(self.font, "PRESS-ESC TO CANCEL", BLACK, 390, 600)
+
+        elif stage == GameStage.GENERATE_FAILED:
+            self.draw_text(self.medium_font, "Cannot generate quizzes!", RED, 50, 50)
+            self.draw_text(self.font, "PRESS-ENTER TO CHOOSE ANOTHER TOPIC", BLACK, 300, 600)
+
+        elif stage == GameStage.QUIZ:
+            pygame.draw.rect(self.surface, LIGHT_PURPLE, pygame.Rect(0, 100, QUESTION_WIDTH, QUESTION_HEIGHT))
+            pygame.draw.rect(self.surface, RED, pygame.Rect(0, 400, RECT_WIDTH, RECT_HEIGHT))
+            pygame.draw.rect(self.surface, YELLOW, pygame.Rect(0, 600, RECT_WIDTH, RECT_HEIGHT))
+            pygame.draw.rect(self.surface, BLUE, pygame.Rect(500, 400, RECT_WIDTH, RECT_HEIGHT))
+            pygame.draw.rect(self.surface, GREEN, pygame.Rect(500, 600, RECT_WIDTH, RECT_HEIGHT))
+            self.draw_decorative()
+
+        elif stage == GameStage.CORRECT:
+            self.draw_text(self.big_font, "CORRECT!", BLACK, 320, 330)
+            self.draw_text(self.font, "PRESS-ENTER TO CONTINUE", BLACK, 360, 470)
+
+        elif stage == GameStage.INCORRECT:
+            self.draw_text(self.big_font, "INCORRECT!", BLACK, 300, 330)
+            self.draw_text(self.font, "PRESS-ENTER TO CONTINUE", BLACK, 360, 500)
+
+        elif stage == GameStage.END:
+            self.draw_text(self.font, "RIGHT-CLICK TO CONTINUE PLAYING", BLACK, 320, 550)
+            self.draw_text(self.font, "PRESS-ENTER TO END GAME", BLACK, 360, 600)
+
+    def load_fonts(self) -> None:
+        if self.medium_font is None:
+            self.medium_font = pygame.font.SysFont(None, 60)
+            self.big_font = pygame.font.SysFont(None, 100)
+            self.small_font = pygame.font.SysFont(None, 24)
+
+    def background(self, stage: GameStage) -> pygame.Surface:
+        if stage not in self.backgrounds:
+            self.load_fonts()
+            screen = self.surface
+            frame_rects = self.frame_rects
+            self.surface = pygame.Surface(screen.get_size()).convert()
+            self.draw_background(stage)
+            self.backgrounds[stage] = self.surface
+            self.surface = screen
+            self.frame_rects = frame_rects
+        return self.backgrounds[stage]
+
+    def warm_up(self) -> bool:
+        for stage in GameStage:
+            # No frame is drawn on LEAVE, which ends the loop, or on UPDATE, which step() moves past first.
+            if stage not in [GameStage.LEAVE, GameStage.UPDATE] and stage not in self.backgrounds:
+                self.background(stage)
+                return True
+        return False
+
+    def draw_interface(self) -> None:
         self.draw_text(self.font, f"Name: {self.player.name}", RED, 50, 30)
         self.draw_text(self.font, f"Question No.{self.q_number+1}", RED, 400, 30)
         self.draw_text(self.font, f"Score: {self.player.score}/5", RED, 850, 30)
@@ -355,232 +1993,309 @@ class Gameplay:
         self.draw_text(self.font, self.choices[self.q_number][2], WHITE, 100, 690, 450, 750, is_choice=True)
         self.draw_text(self.font, self.choices[self.q_number][3], WHITE, 600, 690, 950, 750, is_choice=True)
 
+    def show_quiz(self) -> None:
+        if self.q_number >= len(self.questions):
+            self.surface.blit(self.background(GameStage.GENERATE_QUIZ), (0, 0))
+            self.show_loading()
+            return
+        self.draw_interface()
+        if self.pending_answer is not None:
+            # The answer key only arrives at the end of the stream.
+            self.draw_text(self.font, "checking answer...", BLACK, 420, 360)
+
     def show_options(self) -> None:
         pygame.draw.rect(self.surface, RED, pygame.Rect(340, 710, 280, 40))
         pygame.draw.rect(self.surface, RED, pygame.Rect(690, 710, 230, 40))
         self.draw_text(self.font, "QUIZ LEADERBOARD", BLACK, 700, 720)
         self.draw_text(self.font, "TOP QUIZ PERFORMANCE", BLACK, 350, 720)
 
-    def check_option(self, pos: tuple[int, int]) -> None:
+    def check_option(self, pos: tuple[int, int]) -> tuple[Action, any] | None:
         x, y = pos
         if 690 < x < 920 and 710 < y < 750:
-            self.stage = GameStage.LEADERBOARD
-            logger.info(
-                "Player (%s) see top 5 quizzes.",
-                self.player.name
-            )
-        elif 340 < x < 620 and 710 < y < 750:
-            self.stage = GameStage.PERFORMANCE
-            logger.info(
-                "Player (%s) see performance of top 5 quizzes.",
-                self.player.name
+            return (Action.LEADERBOARD, None)
+        if 340 < x < 620 and 710 < y < 750:
+            return (Action.PERFORMANCE, None)
+
+    def show_rank(self) -> None:
+        for idx, quiz in enumerate(self.quizzes_data.leaderboard.top(5)):
+            self.draw_text(self.font,
+                           f"{idx+1}.{quiz["topic"]} - correct_rate: {quiz["correct_percentage"]}%",
+                           BLUE,
+                           100,
+                           110 + (40*idx)
             )
-
-    def show_rank(self, option:str) -> None:
-        if option == "leaderboard":
-            self.draw_text(self.medium_font, "Top 5 Quality quiz!",BLUE, 100, 50)
-        else:
-            self.draw_text(self.medium_font, "Select the quiz!",BLUE, 100, 50)
-        self.draw_text(self.font, "PRESS-ENTER TO EXIT", BLACK, 360, 600)
-        for idx, quiz in enumerate(self.quizzes_data.leaderboard):
-            if idx < 5:
-                self.draw_text(self.font,
-                               f"{idx+1}.{quiz["topic"]} - correct_rate: {quiz["correct_percentage"]}%",
-                               BLUE,
-                               100,
-                               110 + (40*idx)
-                )
-            else:
-                break
     
+
     def check_plot(self, pos: tuple[int, int]) -> None:
         y = pos[1]
         y_list = [140, 180, 220, 260, 300]
         if y > 100:
             for idx, y_bottom in enumerate(y_list):
                 if y < y_bottom:
-                    return idx
+                    if idx < len(self.quizzes_data.leaderboard.top(5)):
+                        return idx
+                    break
         return
 
+    @timed("plot")
     def plot(self, choice: int) -> None:
-        topic = self.quizzes_data.leaderboard[choice]["topic"]
+        q_idx = self.quizzes_data.leaderboard.top_indices(5)[choice]
+        quiz = self.quizzes_data.quiz(q_idx)
+        topic = quiz["topic"]
         logger.info(
                 "Player (%s) see performance on (%s)",
                 self.player.name,
                 topic
             )
-        data = self.quizzes_data.leaderboard[choice]["all_score"]
-        values, counts = np.unique(data, return_counts=True)
-
-        plt.bar(values, counts, color='skyblue')
-        plt.xlabel("Score")
-        plt.ylabel("Count")
-        plt.title(f"Player's score on topic: {topic}")
-        plt.savefig(PLOT_PATH)
-        plt.close()
-
-    def show_plot(self):
-        imp = pygame.image.load(PLOT_PATH).convert()
-        self.surface.blit(imp, (180, 0))
-        self.draw_text(self.font, "PRESS-ENTER TO EXIT", BLACK, 360, 600)
-
-    def make_json(self) -> dict[str, any]:
-        data = {
-            "topic": self.topic,
-            "questions": self.questions,
-            "choices": self.choices,
-            "correct_answers": self.correct_answers,
-            "use_count": 1,
-            "all_score": [self.player.score],
-            "correct_percentage": 0
-        }
-        return data
+        # A quiz's scores only grow, so the count tells whether the plot is stale.
+        cached = self.plot_cache.get(q_idx)
+        if cached is None or cached[0] != len(quiz["all_score"]):
+            if PLOT_RENDERER == "matplotlib":
+                surface = self.render_plot_matplotlib(topic, quiz["all_score"])
+            else:
+                surface = self.render_plot(topic, quiz["all_score"])
+            cached = (len(quiz["all_score"]), surface)
+            self.plot_cache[q_idx] = cached
+        self.plot_surface = cached[1]
+        self.plot_stats = self.quizzes_data.question_stats(q_idx)
+
+    def render_plot(self, topic: str, all_score: list[int]) -> pygame.Surface:
+        import numpy as np
+
+        self.load_fonts()
+        counts = np.bincount(np.asarray(all_score, dtype=np.int64), minlength=6)
+        surface = pygame.Surface((PLOT_WIDTH, PLOT_HEIGHT)).convert()
+        surface.fill(WHITE)
+        left, top, right, bottom = 80, 60, 600, 410
+        y_step = max(1, -(-int(counts.max()) // 5))
+        y_max = y_step * max(1, -(-int(counts.max()) // y_step))
+
+        title = self.font.render(f"Player's score on topic: {topic}", True, BLACK)
+        surface.blit(title, title.get_rect(center=(PLOT_WIDTH // 2, 30)))
+        slot = (right - left) / len(counts)
+        for score, count in enumerate(counts):
+            height = round((bottom - top) * count / y_max)
+            bar = pygame.Rect(round(left + slot * (score + 0.1)), bottom - height, round(slot * 0.8), height)
+            pygame.draw.rect(surface, SKY_BLUE, bar)
+            label = self.small_font.render(str(score), True, BLACK)
+            surface.blit(label, label.get_rect(midtop=(bar.centerx, bottom + 6)))
+        for tick in range(0, y_max + 1, y_step):
+            y = bottom - round((bottom - top) * tick / y_max)
+            pygame.draw.line(surface, BLACK, (left - 5, y), (left, y))
+            label = self.small_font.render(str(tick), True, BLACK)
+            surface.blit(label, label.get_rect(midright=(left - 8, y)))
+        pygame.draw.lines(surface, BLACK, False, [(left, top), (left, bottom), (right, bottom)])
+
+        x_label = self.small_font.render("Score", True, BLACK)
+        surface.blit(x_label, x_label.get_rect(center=((left + right) // 2, bottom + 45)))
+        y_label = pygame.transform.rotate(self.small_font.render("Count", True, BLACK), 90)
+        surface.blit(y_label, y_label.get_rect(center=(25, (top + bottom) // 2)))
+        return surface
+
+    def render_plot_matplotlib(self, topic: str, all_score: list[int]) -> pygame.Surface:
+        import numpy as np
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        values, counts = np.unique(all_score, return_counts=True)
+        figure = Figure(figsize=(PLOT_WIDTH / 100, PLOT_HEIGHT / 100), dpi=100)
+        canvas = FigureCanvasAgg(figure)
+        axes = figure.add_subplot()
+        axes.bar(values, counts, color='skyblue')
+        axes.set_xlabel("Score")
+        axes.set_ylabel("Count")
+        axes.set_title(f"Player's score on topic: {topic}")
+        canvas.draw()
+        # Wrap the Agg buffer without copying; convert() makes the one copy that is cached.
+        return pygame.image.frombuffer(canvas.buffer_rgba(), canvas.get_width_height(), "RGBA").convert()
+
+    def show_plot(self) -> None:
+        self.frame_rects.append(self.surface.blit(self.plot_surface, (180, 0)))
+        for idx, stats in enumerate(self.plot_stats):
+            discrimination = stats["discrimination"]
+            self.draw_text(self.font,
+                           f"Q{stats['question'] + 1}: {100 * stats['difficulty']:.0f}% correct, "
+                           f"discrimination {'-' if discrimination is None else f'{discrimination:.2f}'}, "
+                           f"{stats['working_distractors']}/3 distractors work, {stats['mean_seconds']:.1f} s",
+                           BLUE,
+                           100,
+                           500 + (40*idx)
+            )
 
-    def update(self) -> None:
-        data = self.make_json()
-        self.quizzes_data.record_data(self.is_new_quiz, self.q_idx, self.topic, data)
-        self.choices = []
-        self.questions = []
-        self.q_number = 0
-        self.correct_answers = []
-        self.is_new_quiz = True
-        self.stage = GameStage.END
-        logger.info(
-            "Player: (%s) finish quizzes on topic: (%s) with score: (%d)",
-            self.player.name, self.topic, self.player.score
-        )
+    def reset_quiz(self) -> None:
+        super().reset_quiz()
+        self.text_cache.clear()
 
     def end_game(self) -> None:
         self.draw_text(self.medium_font, f"Name: {self.player.name}", RED, 50, 50)
         self.draw_text(self.medium_font, f"Topic: {self.topic}", RED, 50, 120)
         self.draw_text(self.medium_font, f"Final Score: {self.player.score}/5", RED, 50, 190)
-        self.draw_text(self.font, "RIGHT-CLICK TO CONTINUE PLAYING", BLACK, 320, 550)
-        self.draw_text(self.font, "PRESS-ENTER TO END GAME", BLACK, 360, 600)
+
+    def scene(self) -> tuple:
+        return (self.stage, self.q_number, len(self.questions), len(self.correct_answers))
+
+    def is_animated(self) -> bool:
+        if self.show_metrics or self.stage == GameStage.GENERATE_QUIZ:
+            return True
+        if self.stage == GameStage.QUIZ:
+            return self.generation is not None or self.pending_answer is not None
+        return False
+
+    def next_events(self) -> list[pygame.event.Event]:
+        if self.is_animated() or self.scene() != self.shown_scene or self.warm_up():
+            return pygame.event.get()
+        # Nothing changes on screen until the player does something, or a typing pause starts a prefetch.
+        due = self.prefetch_due()
+        event = pygame.event.wait(IDLE_WAIT if due is None else min(IDLE_WAIT, int(1000 * due) + 1))
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+
+    def present(self, scene: tuple) -> None:
+        if scene != self.shown_scene:
+            pygame.display.flip()
+        else:
+            pygame.display.update(self.shown_rects + self.frame_rects)
+        self.shown_scene = scene
+        self.shown_rects = self.frame_rects
+        self.frame_rects = []
+
+    def translate(self, event: pygame.event.Event) -> tuple[Action, any] | None:
+        if event.type == pygame.QUIT:
+            return (Action.QUIT, None)
+
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_BACKSPACE:
+                return (Action.BACKSPACE, None)
+            if event.key == pygame.K_RETURN:
+                return (Action.ENTER, None)
+            if event.key == pygame.K_ESCAPE:
+                return (Action.ESCAPE, None)
+            if event.unicode:
+                return (Action.TYPE, event.unicode)
+
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if event.button == 3:
+                return (Action.CONTINUE, None)
+            if event.button == 1:
+                # The click position, not the current one, so recorded sessions replay the same.
+                mouse_pos = event.pos
+                if self.stage in [GameStage.NAME, GameStage.TOPIC]:
+                    return self.check_option(mouse_pos)
+                if self.stage == GameStage.PERFORMANCE:
+                    plt_choice = self.check_plot(mouse_pos)
+                    if plt_choice is not None:
+                        return (Action.PLOT, plt_choice)
+                elif self.stage == GameStage.QUIZ:
+                    answer = self.handle_quiz_input(mouse_pos)
+                    if answer is not None:
+                        return (Action.CHOOSE, answer)
+
+    def handle(self, action: Action, value: any = None) -> None:
+        stage = self.stage
+        super().handle(action, value)
+        if stage == GameStage.PERFORMANCE and self.stage == GameStage.PLOT:
+            self.plot(value)
+        elif stage == GameStage.NAME and self.stage == GameStage.TOPIC:
+            print(f"User's name: {self.player.name}")
+        elif stage == GameStage.TOPIC and self.stage == GameStage.GENERATE_QUIZ:
+            print(f"Topic chosen: {self.player.topic}")
+
+    def start_generation(self) -> None:
+        print(f"generating quizzes for {self.player.topic}, please wait...")
+        super().start_generation()
 
     def start_game(self) -> None:
-        self.clock.tick(30)
-        tmp_stage = ""
-        plt_choice = None
         running = True
         while running:
-            self.surface.fill(WHITE)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT or self.stage == GameStage.LEAVE:
-                    print(f"{self.player.name} exit quizzes game.")
-                    running = False
-                    logger.info(
-                        "Player: (%s) exit quizzes game",
-                        self.player.name
-                    )
+            self.clock.tick(FPS)
+            events = self.next_events()
+
+            for event in events:
+                if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    self.shown_scene = None
+
+                if event.type == pygame.VIDEORESIZE:
+                    self.backgrounds = {}
+                    self.shown_scene = None
+
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.show_metrics = not self.show_metrics
+                    self.shown_scene = None
+                    continue
+
+                action = self.translate(event)
+                if action is not None:
+                    self.handle(*action)
+                if self.stage == GameStage.LEAVE:
                     break
 
-                if event.type == pygame.KEYDOWN:
-                    if self.stage == GameStage.NAME:
-                        self.handle_name_input(event)
-                    
-                    elif self.stage == GameStage.TOPIC:
-                        self.handle_topic_input(event)
-                    
-                    elif self.stage in [GameStage.LEADERBOARD, GameStage.PERFORMANCE]:
-                        if event.key == pygame.K_RETURN:
-                            self.stage = tmp_stage
-
-                    elif self.stage == GameStage.PLOT:
-                        if event.key == pygame.K_RETURN:
-                            self.stage = GameStage.PERFORMANCE
-
-                    elif self.stage in [GameStage.CORRECT, GameStage.INCORRECT]:
-                        if event.key == pygame.K_RETURN:
-                            self.stage = GameStage.QUIZ
-                            self.q_number += 1
-                    
-                    elif self.stage == GameStage.END:
-                        if event.key == pygame.K_RETURN:
-                            self.stage = GameStage.LEAVE
-
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:
-                        if self.stage in [GameStage.NAME, GameStage.TOPIC]:
-                            tmp_stage = self.stage
-                            mouse_pos = pygame.mouse.get_pos()
-                            self.check_option(mouse_pos)
-
-                        elif self.stage == GameStage.PERFORMANCE:
-                            mouse_pos = pygame.mouse.get_pos()
-                            plt_choice = self.check_plot(mouse_pos)
-                            if plt_choice is not None:
-                                self.stage = GameStage.PLOT
-                                self.plot(plt_choice)
-
-                        elif self.stage == GameStage.QUIZ:
-                            mouse_pos = pygame.mouse.get_pos()
-                            answer = self.handle_quiz_input(mouse_pos)
-                            self.check_answer(answer)
-
-                    elif self.stage == GameStage.END:
-                        if event.button == 3:
-                            self.stage = GameStage.TOPIC
-                            self.player.score = 0
-                            self.quizzes_data = Quizzes_data()
-                            logger.info(
-                                "Player: (%s) continue the quizzes game",
-                                self.player.name
-                            )
+            if self.stage == GameStage.LEAVE:
+                print(f"{self.player.name} exit quizzes game.")
+                self.cancel_generation()
+                running = False
+                logger.info(
+                    "Player: (%s) exit quizzes game",
+                    self.player.name
+                )
+                break
+
+            self.step()
+            METRICS.write_due()
+            if (not self.is_animated() and self.scene() == self.shown_scene
+                    and all(event.type == pygame.MOUSEMOTION for event in events)):
+                continue
+
+            frame_start = time.perf_counter()
+            scene = self.scene()
+            self.surface.blit(self.background(self.stage), (0, 0))
 
             if self.stage == GameStage.NAME:
-                self.draw_text(self.font, "Welcome to the quiz game!", RED, 50, 50)
                 self.draw_text(self.font, f"Please enter your name: {self.player.name}|", RED, 50, 80)
-                self.show_options()
 
             elif self.stage == GameStage.TOPIC:
                 self.draw_text(self.font, f"Hi! {self.player.name}", RED, 50, 50)
-                self.draw_text(self.font, "What topic do you want to quiz?", RED, 50, 80)
                 self.draw_text(self.font, f"Enter topic: {self.player.topic}|", RED, 50, 110)
-                self.show_options()
 
-            elif self.stage == GameStage.LEADERBOARD:
-                self.show_rank("leaderboard")
+            elif self.stage in [GameStage.LEADERBOARD, GameStage.PERFORMANCE]:
+                self.show_rank()
 
-            elif self.stage == GameStage.PERFORMANCE:
-                self.show_rank("performance")
-            
             elif self.stage == GameStage.PLOT:
                 self.show_plot()
 
             elif self.stage == GameStage.GENERATE_QUIZ:
-                print(f"generating quizzes for {self.player.topic}, please wait...")
-                self.draw_text(self.font, "generating quizzes, please wait...", RED, 50, 50)
-                response = self.mistral_ai.call(self.player.topic, self.quizzes_data.all_topics)
-                logger.info(response)
-                self.extract_response(response=response)
-                self.stage = GameStage.QUIZ
+                self.show_loading()
 
-            elif self.stage == GameStage.QUIZ:
-                if self.q_number < 5:
-                    self.draw_interface()
-                else:
-                    self.stage = GameStage.UPDATE
+            elif self.stage == GameStage.GENERATE_FAILED:
+                self.show_generate_failed()
 
-            elif self.stage == GameStage.CORRECT:
-                self.show_correct_interface()
+            elif self.stage == GameStage.QUIZ:
+                self.show_quiz()
 
             elif self.stage == GameStage.INCORRECT:
                 self.show_incorrect_interface()
 
-            elif self.stage == GameStage.UPDATE:
-                self.update()
-
             elif self.stage == GameStage.END:
                 self.end_game()
 
-            pygame.display.flip()
+            if self.show_metrics:
+                self.show_metrics_overlay()
+            self.present(scene)
+            METRICS.record("frame", time.perf_counter() - frame_start, self.stage.name)
 
+        self.close()
+        if METRICS_INTERVAL:
+            METRICS.write()
         pygame.quit()
 
 def main() -> None:
-    gameplay = Gameplay()
-    gameplay.start_game()
+    listener = setup_logger()
+    try:
+        pygame.init()
+        gameplay = Gameplay()
+        gameplay.start_game()
+    finally:
+        listener.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,115 @@
+
+# ----- Libraries ----- #
+import os
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+# ----- --------- ----- #
+
+# bench sets up a throwaway store, log directory and dummy display before importing game.
+import bench
+from bench import game
+from game import Action, GameStage
+
+
+def play_session(engine: game.Game_engine, name: str, topic: str, rng: random.Random) -> None:
+    engine.handle(Action.TYPE, name)
+    engine.handle(Action.ENTER)
+    engine.handle(Action.TYPE, topic)
+    engine.handle(Action.ENTER)
+    while engine.stage != GameStage.END:
+        if engine.stage == GameStage.QUIZ and engine.pending_answer is None and engine.q_number < len(engine.questions):
+            engine.handle(Action.CHOOSE, rng.randint(1, 4))
+        elif engine.stage in [GameStage.CORRECT, GameStage.INCORRECT]:
+            engine.handle(Action.ENTER)
+        elif engine.stage == GameStage.GENERATE_FAILED:
+            raise RuntimeError(f"generation failed for {topic}")
+        else:
+            engine.step()
+            if engine.stage == GameStage.GENERATE_QUIZ or engine.pending_answer is not None:
+                time.sleep(0.0005)
+    engine.handle(Action.ENTER)
+
+def run_worker(worker: int, db_path: str, players: int, delay: float, new_rate: float, seed: int) -> dict[str, any]:
+    rng = random.Random(seed + worker)
+    random.seed(seed + worker)
+    quizzes_data = game.Quizzes_data(db_path)
+    generator = game.Fixture_generator(delay)
+    topics = list(quizzes_data.all_topics)
+    sessions = []
+    errors = Counter()
+    wall = time.perf_counter()
+    for player in range(players):
+        if rng.random() < new_rate:
+            topic = f"{bench.make_topic(player)} {worker} {player}"
+        else:
+            topic = rng.choice(topics)
+        engine = game.Game_engine(quizzes_data, generator)
+        start = time.perf_counter()
+        try:
+            play_session(engine, f"player {worker}-{player}", topic, rng)
+            sessions.append(time.perf_counter() - start)
+        except (sqlite3.Error, RuntimeError) as error:
+            errors[f"{type(error).__name__}: {error}"] += 1
+        finally:
+            engine.close()
+    wall = time.perf_counter() - wall
+    writes = game.METRICS.histograms.get(("record_data", ""))
+    return {
+        "worker": worker,
+        "wall": wall,
+        "sessions": sessions,
+        "errors": errors,
+        "record_data": (writes.percentile(50), writes.percentile(99), writes.count) if writes else None
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run scripted players through full quiz sessions")
+    parser.add_argument("--players", type=int, default=2_000, help="sessions per worker")
+    parser.add_argument("--workers", type=int, default=1, help="processes sharing one store")
+    parser.add_argument("--quizzes", type=int, default=1_000, help="quizzes in the starting store")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds the stub generator takes")
+    parser.add_argument("--new-rate", type=float, default=0.3, help="share of sessions on a new topic")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    db_path = os.path.join(bench.BENCH_DIR, "sessions.db")
+    shutil.copy(bench.make_store(args.quizzes), db_path)
+
+    jobs = [(worker, db_path, args.players, args.delay, args.new_rate, args.seed) for worker in range(args.workers)]
+    wall = time.perf_counter()
+    if args.workers == 1:
+        results = [run_worker(*jobs[0])]
+    else:
+        with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(run_worker, *zip(*jobs)))
+    wall = time.perf_counter() - wall
+
+    sessions = [duration for result in results for duration in result["sessions"]]
+    errors = sum((result["errors"] for result in results), Counter())
+    print(f"{len(sessions)} sessions in {wall:.2f} s ({len(sessions) / wall:.0f} sessions/s), {sum(errors.values())} failed")
+    if sessions:
+        bench.report("session", sessions)
+    for result in results:
+        if result["record_data"] is not None:
+            p50, p99, count = result["record_data"]
+            print(f"worker {result['worker']}: {len(result['sessions'])} sessions in {result['wall']:.2f} s, "
+                  f"record_data p50 {1000 * p50:.3f} ms p99 {1000 * p99:.3f} ms over {count} writes")
+    for error, count in errors.most_common(5):
+        print(f"    {count:>6} x {error}")
+
+    conn = sqlite3.connect(db_path)
+    scores = conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+    quizzes = conn.execute("SELECT COUNT(*) FROM quizzes").fetchone()[0]
+    conn.close()
+    print(f"store now holds {quizzes} quizzes and {scores} scores")
+
+if __name__ == "__main__":
+    main()
+# End of file
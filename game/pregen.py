@@ -0,0 +1,158 @@
+
+# ----- Libraries ----- #
+import sys
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+# ----- --------- ----- #
+
+import game
+from game import llm_logger, normalize_topic
+
+
+class Token_bucket:
+    def __init__(self, rate: float, burst: int) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"a token bucket needs a positive rate and burst, got rate {rate} and burst {burst}")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def generate_one(generator: game.Quiz_generator,
+                 bucket: Token_bucket,
+                 topic: str,
+                 old_topic: list[str],
+                 retries: int,
+                 backoff: float) -> game.Quiz_parser | None:
+    for attempt in range(retries + 1):
+        if attempt:
+            # Exponential backoff with jitter so retries from all workers do not line up.
+            time.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+        bucket.acquire()
+        parser = game.Quiz_parser()
+        try:
+            response = generator.generate(topic, old_topic, parser)
+        except ValueError as error:
+            llm_logger.warning("Invalid quizzes on topic: (%s), attempt (%d): (%s)", topic, attempt + 1, error)
+            continue
+        if response is not None and parser.finished:
+            return parser
+        llm_logger.warning("Cannot extract quizzes on topic: (%s), attempt (%d)", topic, attempt + 1)
+    return None
+
+def pregenerate(quizzes_data: game.Quizzes_data,
+                generator: game.Quiz_generator,
+                topics: list[str],
+                workers: int = 4,
+                rate: float = 1.0,
+                burst: int = 2,
+                retries: int = 3,
+                backoff: float = 1.0,
+                force: bool = False) -> tuple[list[str], list[str]]:
+    pending = {}
+    for topic in topics:
+        key = normalize_topic(topic)
+        if key and key not in pending and (force or quizzes_data.resolve_topic(topic) is None):
+            pending[key] = topic
+    # Workers would queue on the retriever lock, so every prompt's old topics are picked up front.
+    old_topics = {topic: quizzes_data.nearest_topics(topic) for topic in pending.values()}
+
+    bucket = Token_bucket(rate, burst)
+    generated = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(generate_one, generator, bucket, topic, old_topics[topic], retries, backoff): topic
+            for topic in pending.values()
+        }
+        for future in as_completed(futures):
+            parser = future.result()
+            if parser is None:
+                failed.append(futures[future])
+            else:
+                generated.append((futures[future], parser))
+            print(f"\r{len(generated)} generated, {len(failed)} failed of {len(futures)}", end="", file=sys.stderr)
+    print(file=sys.stderr)
+
+    quizzes = []
+    aliases = {}
+    # A stored quiz that used up its plays is what sent its topic to generation; its replacement is kept.
+    seen = set() if force else {
+        key for key, q_idx in quizzes_data.topic_index.items() if quizzes_data.use_counts[q_idx] < game.REUSE_LIMIT
+    }
+    for raw_topic, parser in generated:
+        key = normalize_topic(parser.topic)
+        if key != normalize_topic(raw_topic):
+            aliases[normalize_topic(raw_topic)] = key
+        if key in seen:
+            continue
+        seen.add(key)
+        quizzes.append({
+            "topic": parser.topic,
+            "questions": parser.questions,
+            "choices": parser.choices,
+            "correct_answers": parser.correct_answers,
+            "use_count": 0,
+            "all_score": [],
+            "correct_percentage": 0
+        })
+
+    # One transaction for the whole batch.
+    quizzes_data.add_quizzes(quizzes, aliases)
+    llm_logger.info("Pre-generate (%d) quizzes, (%d) topics failed", len(quizzes), len(failed))
+    return [quiz["topic"] for quiz in quizzes], failed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Generate quizzes for a list of topics ahead of time. "
+                    "Running games pick them up on their next topic."
+    )
+    parser.add_argument("topics", help="file with one topic per line, or - for stdin")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent LLM calls")
+    parser.add_argument("--rate", type=float, default=1.0, help="LLM calls started per second")
+    parser.add_argument("--burst", type=int, default=2, help="calls that may start at once after a pause")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=1.0, help="seconds before the first retry, doubled each time")
+    parser.add_argument("--force", action="store_true", help="also generate topics the store already has")
+    args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate must be above 0")
+    if args.burst < 1:
+        parser.error("--burst must be at least 1")
+
+    with (sys.stdin if args.topics == "-" else open(args.topics, "r")) as file:
+        topics = [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+    listener = game.setup_logger()
+    try:
+        start = time.monotonic()
+        added, failed = pregenerate(
+            game.Quizzes_data(), game.make_generator(), topics,
+            args.workers, args.rate, args.burst, args.retries, args.backoff, args.force
+        )
+        print(f"Added {len(added)} quizzes in {time.monotonic() - start:.1f}s")
+        for topic in failed:
+            print(f"Failed: {topic}")
+    finally:
+        listener.stop()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
+# End of file
@@ -0,0 +1,231 @@
+
+# ----- Libraries ----- #
+import os
+import gzip
+import json
+import time
+import argparse
+import resource
+from collections import deque
+# ----- --------- ----- #
+
+import game
+from game import pygame, logger
+
+# ----- Constant ----- #
+RECORDING_VERSION = 1
+# Only events the game reacts to are kept; mouse motion alone would dwarf the rest.
+RECORDED_EVENTS = {
+    pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN,
+    pygame.VIDEORESIZE, pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED
+}
+EVENT_FIELDS = {"key", "unicode", "mod", "button", "pos", "w", "h", "size"}
+REPLAY_TIMEOUT = 10.0
+# Whether an answer was right depends on the quiz the replay store serves, not on the player.
+SAME_SCREEN = {"INCORRECT": "CORRECT"}
+# ----- -------- ----- #
+
+
+def open_recording(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def encode_event(event: pygame.event.Event) -> list:
+    return [event.type, {field: value for field, value in event.dict.items() if field in EVENT_FIELDS}]
+
+def decode_event(event: list) -> pygame.event.Event:
+    event_type, fields = event
+    return pygame.event.Event(
+        event_type, {field: tuple(value) if isinstance(value, list) else value for field, value in fields.items()}
+    )
+
+def save_recording(path: str, batches: list[dict[str, any]], responses: list[tuple[str, str | None]]) -> None:
+    with open_recording(path, "w") as file:
+        file.write(json.dumps({"recording": RECORDING_VERSION, "batches": len(batches), "responses": len(responses)}) + "\n")
+        for batch in batches:
+            file.write(json.dumps(batch, separators=(",", ":")) + "\n")
+        for topic, response in responses:
+            file.write(json.dumps({"topic": topic, "response": response}, separators=(",", ":")) + "\n")
+
+def load_recording(path: str) -> tuple[list[dict[str, any]], dict[str, list[str | None]]]:
+    batches = []
+    responses = {}
+    with open_recording(path, "r") as file:
+        header = json.loads(file.readline())
+        if header.get("recording") != RECORDING_VERSION:
+            raise ValueError(f"{path} is not a version {RECORDING_VERSION} recording")
+        for line in file:
+            entry = json.loads(line)
+            if "events" in entry:
+                batches.append(entry)
+            else:
+                responses.setdefault(entry["topic"], []).append(entry["response"])
+    return batches, responses
+
+class Recording_generator(game.Wrapped_generator):
+    def __init__(self, backend: game.Quiz_generator) -> None:
+        super().__init__(backend)
+        self.responses = []
+
+    def generate(self, topic: str, old_topic: list, parser: game.Quiz_parser) -> str:
+        response = self.backend.generate(topic, old_topic, parser)
+        # A discarded prefetch says nothing about what the player saw.
+        if not parser.cancelled:
+            self.responses.append((topic, response if parser.finished else None))
+        return response
+
+class Replay_generator(game.Quiz_generator):
+    name = "replay"
+
+    def __init__(self, responses: dict[str, list[str | None]]) -> None:
+        super().__init__("replay")
+        self.responses = {topic: deque(recorded) for topic, recorded in responses.items()}
+
+    def complete(self, prompt: str) -> str:
+        # Topics the recorded store already had were never generated; any deterministic quiz will do.
+        return game.fixture_response(prompt)
+
+    def generate(self, topic: str, old_topic: list, parser: game.Quiz_parser) -> str:
+        recorded = self.responses.get(topic)
+        if not recorded:
+            response = self.complete(self.build_prompt(topic, old_topic))
+        else:
+            response = recorded.popleft() if len(recorded) > 1 else recorded[0]
+        if response is not None:
+            parser.feed(response)
+            parser.close()
+        return response
+
+class Recording_gameplay(game.Gameplay):
+    def __init__(self, path: str, quizzes_data: game.Quizzes_data | None = None,
+                 generator: game.Quiz_generator | None = None) -> None:
+        self.path = path
+        self.batches = []
+        super().__init__(quizzes_data, Recording_generator(generator if generator is not None else game.make_generator()))
+
+    def next_events(self) -> list[pygame.event.Event]:
+        events = super().next_events()
+        kept = [encode_event(event) for event in events if event.type in RECORDED_EVENTS]
+        if kept:
+            # The screen the player was looking at; the replay holds the events back until it is there too.
+            self.batches.append({"stage": self.stage.name, "question": self.q_number, "events": kept})
+        return events
+
+    def close(self) -> None:
+        super().close()
+        save_recording(self.path, self.batches, self.mistral_ai.responses)
+        logger.info("Record (%d) event batches and (%d) responses to (%s)",
+                    len(self.batches), len(self.mistral_ai.responses), self.path)
+
+class Replay_gameplay(game.Gameplay):
+    def __init__(self, path: str, quizzes_data: game.Quizzes_data | None = None,
+                 timeout: float = REPLAY_TIMEOUT) -> None:
+        batches, responses = load_recording(path)
+        super().__init__(quizzes_data, Replay_generator(responses))
+        self.batches = deque(batches)
+        self.timeout = timeout
+        self.waiting_since = None
+        self.loops = 0
+
+    def next_events(self) -> list[pygame.event.Event]:
+        self.loops += 1
+        pygame.event.pump()
+        if not self.batches:
+            return [pygame.event.Event(pygame.QUIT)]
+        batch = self.batches[0]
+        stage = SAME_SCREEN.get(self.stage.name, self.stage.name)
+        if (stage, self.q_number) != (SAME_SCREEN.get(batch["stage"], batch["stage"]), batch["question"]):
+            # Generations finish at their own pace; wait for the screen the events were meant for.
+            now = time.monotonic()
+            if self.waiting_since is None:
+                self.waiting_since = now
+            elif now - self.waiting_since > self.timeout:
+                raise RuntimeError(
+                    f"replay diverged: waiting for {batch['stage']} question {batch['question']}, "
+                    f"game is at {self.stage.name} question {self.q_number}"
+                )
+            time.sleep(0.0005)
+            return []
+        self.waiting_since = None
+        self.batches.popleft()
+        return [decode_event(event) for event in batch["events"]]
+
+def merge_histograms(histograms: list[game.Latency_histogram]) -> game.Latency_histogram:
+    merged = game.Latency_histogram()
+    for histogram in histograms:
+        for bucket, count in histogram.counts.items():
+            merged.counts[bucket] = merged.counts.get(bucket, 0) + count
+        merged.count += histogram.count
+        merged.total += histogram.total
+    return merged
+
+def encode_histogram(histogram: game.Latency_histogram) -> list:
+    return [histogram.total, sorted(histogram.counts.items())]
+
+def decode_histogram(encoded: list) -> game.Latency_histogram:
+    histogram = game.Latency_histogram()
+    histogram.total, counts = encoded
+    histogram.counts = {bucket: count for bucket, count in counts}
+    histogram.count = sum(histogram.counts.values())
+    return histogram
+
+def replay(path: str, db_path: str = game.DB_PATH) -> dict[str, any]:
+    # No frame cap: the replay runs as fast as the game can draw.
+    game.FPS = 0
+    pygame.init()
+    gameplay = Replay_gameplay(path, game.Quizzes_data(db_path))
+    start = time.perf_counter()
+    gameplay.start_game()
+    wall = time.perf_counter() - start
+    histograms = dict(game.METRICS.histograms)
+    # All stages together, for the overall frame-time distribution.
+    histograms[("frame", "")] = merge_histograms(
+        [histogram for (name, _), histogram in histograms.items() if name == "frame"]
+    )
+    # Whole histograms rather than percentiles, so runs can be pooled before taking percentiles.
+    return {
+        "loops": gameplay.loops,
+        "wall": wall,
+        # ru_maxrss is in KiB on Linux.
+        "peak_memory": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "histograms": [[name, stage, encode_histogram(histogram)] for (name, stage), histogram in sorted(histograms.items())]
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Record a play session, or replay one headlessly at full speed")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="play normally and save the events and quiz responses")
+    record.add_argument("recording", help="file to write, gzipped when it ends in .gz")
+    play = commands.add_parser("play", help="replay a recording without a display or an LLM")
+    play.add_argument("recording")
+    play.add_argument("--db", default=game.DB_PATH, help="quiz store to replay against")
+    play.add_argument("--json", metavar="PATH", help="write the results as JSON to this file instead of printing them")
+    args = parser.parse_args()
+
+    listener = game.setup_logger()
+    try:
+        if args.command == "record":
+            pygame.init()
+            Recording_gameplay(args.recording).start_game()
+            return
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        result = replay(args.recording, args.db)
+    finally:
+        listener.stop()
+
+    if args.json:
+        # A file of its own: the game prints to the console as it plays.
+        with open(args.json, "w") as file:
+            json.dump(result, file)
+        return
+    print(f"{result['loops']} loops in {result['wall']:.2f} s, peak memory {result['peak_memory'] / 2**20:.1f} MiB")
+    for name, stage, encoded in result["histograms"]:
+        histogram = decode_histogram(encoded)
+        print(f"{name + ' ' + stage:<28} p50 {1000 * histogram.percentile(50):8.3f} ms   "
+              f"p95 {1000 * histogram.percentile(95):8.3f} ms   "
+              f"p99 {1000 * histogram.percentile(99):8.3f} ms   n={histogram.count}")
+
+if __name__ == "__main__":
+    main()
+# End of file
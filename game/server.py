@@ -0,0 +1,395 @@
+
+# ----- Libraries ----- #
+import sys
+import json
+import time
+import heapq
+import random
+import asyncio
+import argparse
+from array import array
+# ----- --------- ----- #
+
+import game
+from game import ENV, logger, log_event, normalize_topic
+
+# ----- Constant ----- #
+HOST = ENV.get("SERVER_HOST", "127.0.0.1")
+PORT = int(ENV.get("SERVER_PORT", 8765))
+QUESTION_TIME = float(ENV.get("QUESTION_TIME", 20))
+RESULT_TIME = float(ENV.get("RESULT_TIME", 3))
+# ----- -------- ----- #
+
+# Messages are JSON objects, one per line, in both directions:
+#   client: join {room, name}, start {topic} (host only), answer {question, choice}
+#   server: joined, player_joined (host only), question, result, end, error
+
+
+def encode(message: dict[str, any]) -> bytes:
+    return (json.dumps(message) + "\n").encode()
+
+class Room_player:
+    def __init__(self, name: str, writer: asyncio.StreamWriter) -> None:
+        self.name = name
+        self.writer = writer
+        self.score = 0
+        self.answer = None
+        self.reset_answers()
+
+    def reset_answers(self) -> None:
+        # Same layout as Game_engine: one slot per question, choice 0 is unanswered.
+        self.choices = array("b", bytes(5))
+        self.seconds = array("f", bytes(20))
+
+class Room:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.players = {}
+        self.host = None
+        self.started = False
+        self.topic = ""
+        self.is_new_quiz = True
+        self.q_idx = 0
+        self.quiz = None
+        self.q_number = 0
+        self.answered = 0
+        self.all_answered = asyncio.Event()
+
+    async def broadcast(self, message: dict[str, any]) -> None:
+        # Encode once; every player gets the same bytes.
+        data = encode(message)
+        players = list(self.players.values())
+        for player in players:
+            player.writer.write(data)
+        await asyncio.gather(*(player.writer.drain() for player in players), return_exceptions=True)
+
+    def top(self, k: int = 5) -> list[tuple[str, int]]:
+        # Every player gets the same message, so it carries the podium rather than all scores.
+        return heapq.nlargest(k, ((player.score, name) for name, player in self.players.items()))
+
+class Store_writer:
+    # A write can wait up to STORE_BUSY_TIMEOUT for another process's lock. It runs on one
+    # thread with its own connection, so the event loop, and every other room, keeps going.
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.executor = game.Daemon_executor(max_workers=1)
+        self.store = None
+
+    def call(self, method: str, *args: any) -> any:
+        if self.store is None:
+            self.store = game.Quiz_store(self.db_path)
+        return getattr(self.store, method)(*args)
+
+    async def run(self, method: str, *args: any) -> any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.call, method, *args)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+class Room_server:
+    def __init__(self,
+                 quizzes_data: game.Quizzes_data | None = None,
+                 generator: game.Quiz_generator | None = None,
+                 question_time: float = QUESTION_TIME,
+                 result_time: float = RESULT_TIME) -> None:
+        self.quizzes_data = quizzes_data if quizzes_data is not None else game.Quizzes_data()
+        self.quizzes_data.start_indexing()
+        self.generator = generator if generator is not None else game.make_generator()
+        self.question_time = question_time
+        self.result_time = result_time
+        self.rooms = {}
+        self.executor = game.Daemon_executor(max_workers=4)
+        self.refresher = game.Quiz_refresher(self.quizzes_data, self.generator)
+        self.store_writer = Store_writer(self.quizzes_data.store.db_path)
+        # The loop only keeps weak references to tasks; a running game must not be collected.
+        self.games = set()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        room = None
+        player = None
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                if player is None:
+                    if message.get("type") != "join":
+                        writer.write(encode({"type": "error", "message": "join a room first"}))
+                        continue
+                    room, player = self.join(message.get("room", ""), message.get("name", ""), writer)
+                elif message.get("type") == "start" and player is room.host and not room.started:
+                    room.started = True
+                    task = asyncio.create_task(self.play(room, message.get("topic", "")))
+                    self.games.add(task)
+                    task.add_done_callback(self.games.discard)
+                elif message.get("type") == "answer":
+                    self.answer(room, player, message)
+        except (ConnectionError, ValueError, TypeError, AttributeError) as error:
+            logger.warning("Drop client on room (%s): (%s)", getattr(room, "name", None), error)
+        finally:
+            if room is not None and player is not None:
+                self.leave(room, player)
+            writer.close()
+
+    def join(self, room_name: str, name: str, writer: asyncio.StreamWriter) -> tuple[Room | None, Room_player | None]:
+        room = self.rooms.get(room_name)
+        if room is None:
+            room = self.rooms[room_name] = Room(room_name)
+        if room.started or not name or name in room.players:
+            writer.write(encode({"type": "error", "message": "room already started or name taken"}))
+            return None, None
+        player = room.players[name] = Room_player(name, writer)
+        if room.host is None:
+            room.host = player
+        writer.write(encode({"type": "joined", "room": room.name, "host": room.host.name}))
+        # Only the host's screen lists the lobby; telling everyone would cost players^2 messages.
+        if room.host is not player:
+            room.host.writer.write(encode({"type": "player_joined", "name": name, "players": len(room.players)}))
+        logger.info("Player: (%s) join room: (%s)", name, room.name)
+        return room, player
+
+    def leave(self, room: Room, player: Room_player) -> None:
+        if room.players.get(player.name) is player:
+            del room.players[player.name]
+        if not room.players:
+            self.rooms.pop(room.name, None)
+            return
+        if room.host is player:
+            room.host = next(iter(room.players.values()))
+        if room.quiz is not None and room.q_number is not None:
+            # An answer from a player who left no longer counts towards closing the question.
+            if player.answer is not None:
+                room.answered -= 1
+            if room.answered >= len(room.players):
+                room.all_answered.set()
+
+    def answer(self, room: Room, player: Room_player, message: dict[str, any]) -> None:
+        # Late answers and answers to an earlier question are ignored.
+        if room.quiz is None or message.get("question") != room.q_number or player.answer is not None:
+            return
+        player.answer = (int(message.get("choice")), time.monotonic())
+        room.answered += 1
+        if room.answered >= len(room.players):
+            room.all_answered.set()
+
+    async def load_quiz(self, room: Room, topic: str) -> bool:
+        quizzes_data = self.quizzes_data
+        # Quizzes written by pregen or another server since the last game are picked up here.
+        quizzes_data.refresh()
+        await self.poll_refresher()
+        q_idx = quizzes_data.resolve_topic(topic)
+        if q_idx is None:
+            parser = game.Quiz_parser()
+            loop = asyncio.get_running_loop()
+            generation = loop.run_in_executor(
+                self.executor, self.generator.generate_for, quizzes_data, topic, parser
+            )
+            try:
+                response = await asyncio.wait_for(generation, game.GENERATE_TIMEOUT)
+            except (ValueError, asyncio.TimeoutError):
+                response = None
+            if response is None or not parser.finished:
+                parser.cancel()
+                logger.warning("Cannot extract quizzes on topic: (%s) for room: (%s)", topic, room.name)
+                return False
+            q_idx = quizzes_data.topic_index.get(normalize_topic(parser.topic))
+            if q_idx is None or quizzes_data.use_counts[q_idx] >= game.REUSE_LIMIT:
+                room.topic = parser.topic
+                room.is_new_quiz = True
+                room.quiz = {
+                    "questions": parser.questions,
+                    "choices": parser.choices,
+                    "correct_answers": parser.correct_answers
+                }
+                await self.save_alias(quizzes_data.learn_alias(topic, room.topic, save=False))
+                return True
+            await self.save_alias(quizzes_data.learn_alias(topic, parser.topic, save=False))
+        room.topic = quizzes_data.all_topics[q_idx]
+        room.is_new_quiz = False
+        room.q_idx = q_idx
+        room.quiz = quizzes_data.quiz(q_idx)
+        return True
+
+    async def play(self, room: Room, topic: str) -> None:
+        try:
+            await self.run_game(room, topic)
+        except Exception as error:
+            logger.warning("Room: (%s) game on topic: (%s) failed: (%r)", room.name, topic, error)
+            await room.broadcast({"type": "error", "message": f"the game on {topic} failed, start again"})
+        finally:
+            # The host can always start again, whatever happened to this game.
+            room.started = False
+            room.quiz = None
+            room.q_number = None
+            for player in room.players.values():
+                player.score = 0
+                player.answer = None
+                player.reset_answers()
+
+    async def run_game(self, room: Room, topic: str) -> None:
+        if not await self.load_quiz(room, topic):
+            await room.broadcast({"type": "error", "message": f"cannot make quizzes on {topic}"})
+            return
+
+        for q_number in range(5):
+            for player in room.players.values():
+                player.answer = None
+            room.answered = 0
+            room.all_answered.clear()
+            room.q_number = q_number
+            asked = time.monotonic()
+            await room.broadcast({
+                "type": "question",
+                "question": q_number,
+                "text": room.quiz["questions"][q_number],
+                "choices": room.quiz["choices"][q_number],
+                "time": self.question_time,
+                "sent": time.perf_counter()
+            })
+            try:
+                await asyncio.wait_for(room.all_answered.wait(), self.question_time)
+            except asyncio.TimeoutError:
+                pass
+
+            correct = int(room.quiz["correct_answers"][q_number])
+            answered = 0
+            for player in room.players.values():
+                if player.answer is not None:
+                    answered += 1
+                    player.score += player.answer[0] == correct
+                    if 1 <= player.answer[0] <= 4:
+                        player.choices[q_number] = player.answer[0]
+                        player.seconds[q_number] = player.answer[1] - asked
+            room.q_number = None
+            await room.broadcast({"type": "result", "question": q_number, "correct": correct, "top": room.top()})
+            log_event(
+                "room_question", room=room.name, topic=room.topic, question=q_number + 1,
+                players=len(room.players), answered=answered, seconds=round(time.monotonic() - asked, 3)
+            )
+            await asyncio.sleep(self.result_time)
+
+        await self.record(room)
+        await room.broadcast({"type": "end", "topic": room.topic, "players": len(room.players), "top": room.top()})
+
+    async def save_alias(self, alias: tuple[str, str] | None) -> None:
+        if alias is not None:
+            await self.store_writer.run("save_alias", *alias)
+
+    async def poll_refresher(self) -> None:
+        finished = self.refresher.finished()
+        for q_idx, job, quiz in finished:
+            self.refresher.swapped(q_idx, job, await self.store_writer.run("replace_quiz", q_idx, quiz))
+        if finished:
+            self.quizzes_data.refresh()
+
+    async def record(self, room: Room) -> None:
+        scores = [player.score for player in room.players.values()]
+        if not scores:
+            return
+        answers = [(player.choices.tobytes(), player.seconds.tobytes()) for player in room.players.values()]
+        data = {
+            "topic": room.topic,
+            "questions": room.quiz["questions"],
+            "choices": room.quiz["choices"],
+            "correct_answers": room.quiz["correct_answers"],
+            "use_count": len(scores),
+            "all_score": scores,
+            "all_answers": answers,
+            "correct_percentage": 0
+        }
+        await self.store_writer.run("record_scores", room.is_new_quiz, room.q_idx, data)
+        # The loop thread's own connection picks up the write; reads never wait on the lock.
+        self.quizzes_data.refresh()
+        await self.poll_refresher()
+        if not room.is_new_quiz:
+            self.refresher.check(room.q_idx)
+        logger.info(
+            "Room: (%s) finish quizzes on topic: (%s) with (%d) players",
+            room.name, room.topic, len(scores)
+        )
+
+    async def serve(self, host: str = HOST, port: int = PORT) -> asyncio.Server:
+        # The backlog has to absorb a whole class connecting at once.
+        return await asyncio.start_server(self.handle_client, host, port, backlog=1024)
+
+    def close(self) -> None:
+        self.refresher.close()
+        self.store_writer.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+async def play_client(host: str, port: int, room: str, name: str) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encode({"type": "join", "room": room, "name": name}))
+    loop = asyncio.get_running_loop()
+    state = {"question": None, "answer": None, "score": 0}
+
+    async def read_input() -> None:
+        while True:
+            line = (await loop.run_in_executor(None, sys.stdin.readline)).strip()
+            if line.startswith("/start "):
+                writer.write(encode({"type": "start", "topic": line[len("/start "):]}))
+            elif line in ["1", "2", "3", "4"] and state["question"] is not None and state["answer"] is None:
+                state["answer"] = int(line)
+                writer.write(encode({"type": "answer", "question": state["question"], "choice": state["answer"]}))
+
+    input_task = asyncio.create_task(read_input())
+    async for line in reader:
+        message = json.loads(line)
+        if message["type"] == "joined":
+            print(f"Joined room {message['room']}, host is {message['host']}. The host types /start <topic>.")
+        elif message["type"] == "player_joined":
+            print(f"{message['name']} joined, {message['players']} players in the room")
+        elif message["type"] == "question":
+            state["question"] = message["question"]
+            state["answer"] = None
+            print(f"\nQuestion No.{message['question'] + 1}: {message['text']}")
+            for idx, choice in enumerate(message["choices"]):
+                print(f"  {idx + 1}. {choice}")
+            print(f"Answer 1-4 within {message['time']:.0f} seconds")
+        elif message["type"] == "result":
+            state["question"] = None
+            state["score"] += state["answer"] == message["correct"]
+            print(f"Correct answer is: {message['correct']}. Your score: {state['score']}")
+            print("Top: " + ", ".join(f"{name} {points}" for points, name in message["top"]))
+        elif message["type"] == "end":
+            print(f"Final Score on {message['topic']}: {state['score']}/5 among {message['players']} players")
+            print("Top: " + ", ".join(f"{name} {points}" for points, name in message["top"]))
+            state["score"] = 0
+        elif message["type"] == "error":
+            print(f"Error: {message['message']}")
+    input_task.cancel()
+
+async def run_server(host: str, port: int) -> None:
+    room_server = Room_server()
+    server = await room_server.serve(host, port)
+    print(f"Serving quiz rooms on {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        room_server.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Multiplayer quiz rooms over TCP")
+    parser.add_argument("mode", choices=["serve", "play"])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--room", default="lobby")
+    parser.add_argument("--name", default=f"player{random.randint(1000, 9999)}")
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        listener = game.setup_logger()
+        try:
+            asyncio.run(run_server(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.stop()
+    else:
+        try:
+            asyncio.run(play_client(args.host, args.port, args.room, args.name))
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
+# End of file
@@ -0,0 +1,85 @@
+
+# ----- Libraries ----- #
+import json
+import time
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+# ----- --------- ----- #
+
+import game
+
+
+class Standin_handler(BaseHTTPRequestHandler):
+    # Speaks enough of the OpenAI chat completions API for OpenAI_compatible, answering from fixtures.
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, keep-alive requests stall ~40 ms.
+    disable_nagle_algorithm = True
+    delay = 0.0
+    chunk_delay = 0.0
+    chunk_size = 40
+
+    def do_POST(self) -> None:
+        if not self.path.endswith("/chat/completions"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        text = game.fixture_response(request["messages"][-1]["content"])
+        time.sleep(self.delay)
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(text), self.chunk_size):
+                delta = {"choices": [{"index": 0, "delta": {"content": text[start:start + self.chunk_size]}}]}
+                self.write_chunk(f"data: {json.dumps(delta)}\n\n")
+                time.sleep(self.chunk_delay)
+            self.write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        body = json.dumps({
+            "object": "chat.completion",
+            "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data: str) -> None:
+        data = data.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, format: str, *args: any) -> None:
+        pass
+
+def make_server(host: str, port: int, delay: float = 0.0, chunk_delay: float = 0.0) -> ThreadingHTTPServer:
+    handler = type("Configured_handler", (Standin_handler,), {"delay": delay, "chunk_delay": chunk_delay})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for an OpenAI-compatible quiz generator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.delay, args.chunk_delay)
+    print(f"Stand-in generator on http://{args.host}:{args.port}/v1 (GENERATOR=openai GENERATOR_URL=...)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+if __name__ == "__main__":
+    main()
+# End of file
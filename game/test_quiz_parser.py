@@ -0,0 +1,89 @@
+
+# ----- Libraries ----- #
+import os
+import unittest
+# ----- --------- ----- #
+
+import game
+
+# ----- Constant ----- #
+PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "database", "prompt.txt")
+# ----- -------- ----- #
+
+
+def example_response() -> str:
+    # The example answer in prompt.txt is exactly what the model is asked to send back.
+    with open(PROMPT_PATH, "r") as file:
+        prompt = file.read()
+    example = prompt.split("Example Output (DO NOT COPY, FOLLOW STRUCTURE):", 1)[1].split("EXTRA:", 1)[0]
+    return example.strip()
+
+def parse(chunks: list[str]) -> game.Quiz_parser:
+    parser = game.Quiz_parser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return parser
+
+class Test_quiz_parser(unittest.TestCase):
+    def setUp(self) -> None:
+        self.response = example_response()
+        self.expected = parse([self.response])
+
+    def test_example(self) -> None:
+        self.assertEqual(self.expected.topic, "quantum mechanics")
+        self.assertEqual(len(self.expected.questions), 5)
+        self.assertTrue(all(len(choices) == 4 for choices in self.expected.choices))
+        self.assertEqual(self.expected.choices[1][2], "Louis de Broglie")
+        self.assertEqual(self.expected.correct_answers, ["1", "3", "3", "1", "1"])
+        self.assertTrue(self.expected.finished)
+
+    def test_split_at_every_offset(self) -> None:
+        # Covers every boundary inside "[]", "///" and "..", and a lone trailing chunk.
+        for offset in range(len(self.response) + 1):
+            with self.subTest(offset=offset):
+                parser = parse([self.response[:offset], self.response[offset:]])
+                self.assertEqual(parser.topic, self.expected.topic)
+                self.assertEqual(parser.questions, self.expected.questions)
+                self.assertEqual(parser.choices, self.expected.choices)
+                self.assertEqual(parser.correct_answers, self.expected.correct_answers)
+
+    def test_one_character_chunks(self) -> None:
+        parser = parse(list(self.response))
+        self.assertEqual(parser.questions, self.expected.questions)
+        self.assertEqual(parser.choices, self.expected.choices)
+        self.assertEqual(parser.correct_answers, self.expected.correct_answers)
+
+    def test_questions_ready_while_streaming(self) -> None:
+        parser = game.Quiz_parser()
+        parser.feed(self.response[:self.response.index("[]", self.response.index("///")) + 1])
+        self.assertEqual(parser.ready(), 0)
+        parser.feed("]")
+        self.assertEqual(parser.ready(), 1)
+
+    def test_missing_choice_separator(self) -> None:
+        response = self.response.replace("///", " ", 1)
+        with self.assertRaises(ValueError):
+            parse([response])
+
+    def test_three_choices(self) -> None:
+        response = self.response.replace("..Planck's Law", "", 1)
+        with self.assertRaises(ValueError):
+            parse([response])
+
+    def test_bad_answer_key(self) -> None:
+        for answers in ["1..3..3..1..5", "1..3..3..1", "1..3..3..1..1..2", "a..b..c..d..e", ""]:
+            with self.subTest(answers=answers):
+                response = self.response.rsplit("[]", 1)[0] + "[]" + answers
+                with self.assertRaises(ValueError):
+                    parse([response])
+
+    def test_missing_question(self) -> None:
+        start = self.response.index("[]") + 2
+        end = self.response.index("[]", start) + 2
+        with self.assertRaises(ValueError):
+            parse([self.response[:start] + self.response[end:]])
+
+if __name__ == "__main__":
+    unittest.main()
+# End of file